@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import time
+import urllib.request
+
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+from utilities import attach_to_session, LatencyStats
+
+# Persistent Chrome profile: the cache, the cookies and the
+# logins are kept between launches
+USER_DATA_DIR = os.path.abspath("chrome_profile")
+
+# Fixed port of the DevTools endpoint
+REMOTE_DEBUGGING_PORT = 9222
+
+# Where the GUI saves how to reach the browser it opened
+SESSION_FILE = "browser_session.json"
+
+# Keep the timers and the rendering of background tabs and hidden
+# windows running at full speed, so the DOM updates the bot waits
+# for are not delayed when the browser is not in front
+LATENCY_FLAGS = [
+    "--disable-background-timer-throttling",
+    "--disable-backgrounding-occluded-windows",
+    "--disable-renderer-backgrounding",
+]
+LATENCY_DISABLED_FEATURES = ["IntensiveWakeUpThrottling", "CalculateNativeWinOcclusion"]
+
+# Features the bot doesn't need
+LEAN_FLAGS = [
+    "--no-first-run",
+    "--no-default-browser-check",
+    "--disable-extensions",
+    "--disable-sync",
+    "--disable-default-apps",
+    "--disable-component-update",
+]
+LEAN_DISABLED_FEATURES = ["Translate", "OptimizationHints", "MediaRouter"]
+
+
+# Returns the Chrome options. With use_profile the managed launch profile is
+# used (see above), otherwise the Chrome defaults with a throwaway profile
+def create_chrome_options(use_profile=True, lean=False, user_data_dir=USER_DATA_DIR):
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    if not use_profile:
+        return options
+
+    # Chrome stays open when chromedriver exits, so a new GUI can reattach to it
+    options.add_experimental_option("detach", True)
+    options.add_argument(f"--user-data-dir={user_data_dir}")
+    options.add_argument(f"--remote-debugging-port={REMOTE_DEBUGGING_PORT}")
+    for flag in LATENCY_FLAGS:
+        options.add_argument(flag)
+
+    # Chrome only reads the last --disable-features flag
+    disabled_features = list(LATENCY_DISABLED_FEATURES)
+    if lean:
+        for flag in LEAN_FLAGS:
+            options.add_argument(flag)
+        disabled_features += LEAN_DISABLED_FEATURES
+    options.add_argument("--disable-features=" + ",".join(disabled_features))
+    return options
+
+
+def save_browser_session(chrome_url, session_id, debugger_address, chromedriver_path, website):
+    session = {
+        "url": chrome_url,
+        "session_id": session_id,
+        "debugger_address": debugger_address,
+        "chromedriver_path": chromedriver_path,
+        "website": website,
+    }
+    with open(SESSION_FILE, "w") as f:
+        json.dump(session, f)
+
+
+def load_browser_session():
+    try:
+        with open(SESSION_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# Returns the DevTools address of a browser the driver launched. A driver
+# attached with attach_to_session has no capabilities, its address is
+# the one saved in the session file
+def get_debugger_address(driver):
+    return (driver.capabilities or {}).get("goog:chromeOptions", {}).get("debuggerAddress")
+
+
+# Returns True if a browser answers on the DevTools address
+# Ex. is_devtools_alive("localhost:9222")
+def is_devtools_alive(debugger_address, timeout=0.5):
+    try:
+        with urllib.request.urlopen(f"http://{debugger_address}/json/version", timeout=timeout):
+            return True
+    except OSError:
+        return False
+
+
+# Reattaches to the browser opened by a previous GUI run
+# Returns (driver, chrome_url) or None if the browser is gone
+def reattach_browser(session):
+    # The chromedriver of the previous run is still running
+    if session.get("url") and session.get("session_id"):
+        try:
+            driver = attach_to_session(session["url"], session["session_id"])
+            driver.current_url
+            return driver, session["url"]
+        except Exception:
+            pass
+
+    # Only Chrome is still running: connect a new chromedriver to it
+    debugger_address = session.get("debugger_address")
+    chromedriver_path = session.get("chromedriver_path")
+    if not debugger_address or not chromedriver_path or not is_devtools_alive(debugger_address):
+        return None
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option("debuggerAddress", debugger_address)
+    driver = webdriver.Chrome(service=ChromeService(chromedriver_path), options=options)
+    return driver, driver.service.service_url
+
+
+# Page whose timer records how late every 50 ms tick fires
+TIMER_PAGE = """data:text/html,<title>timer</title><script>
+window.lags = [];
+let expected = performance.now() + 50;
+function tick() {
+    const now = performance.now();
+    window.lags.push(now - expected);
+    expected = now + 50;
+    setTimeout(tick, 50);
+}
+setTimeout(tick, 50);
+</script>"""
+
+
+# Returns the time from the launch to the loaded page, and the timer
+# lags (seconds) of a tab kept in the background for duration seconds
+def measure(options, url, duration):
+    start_time = time.perf_counter()
+    chrome = webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
+    try:
+        chrome.get(url)
+        cold_start = time.perf_counter() - start_time
+
+        # Open the timer page, then put another tab in front of it
+        chrome.get(TIMER_PAGE)
+        timer_tab = chrome.current_window_handle
+        chrome.switch_to.new_window("tab")
+        chrome.get("about:blank")
+        time.sleep(duration)
+
+        chrome.switch_to.window(timer_tab)
+        lags = [lag / 1000 for lag in chrome.execute_script("return window.lags;")]
+    finally:
+        chrome.quit()
+    return cold_start, lags
+
+
+# Compares the launch profile with the Chrome defaults
+# Ex. python browser_profile.py --url https://lichess.org
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the cold start and the background tab timer lag")
+    parser.add_argument("--url", default="https://lichess.org")
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--lean", action="store_true", help="also disable the unneeded features")
+    arguments = parser.parse_args()
+
+    # The profile is measured in a copy so the real profile is not touched,
+    # the first launch fills its cache and the second one is measured
+    profile_dir = tempfile.mkdtemp(prefix="chrome-profile-")
+    try:
+        for name, options in (
+            ("defaults", create_chrome_options(use_profile=False)),
+            ("profile (first launch)", create_chrome_options(True, arguments.lean, profile_dir)),
+            ("profile", create_chrome_options(True, arguments.lean, profile_dir)),
+        ):
+            cold_start, lags = measure(options, arguments.url, arguments.duration)
+            stats = LatencyStats("background timer lag")
+            for lag in lags:
+                stats.add(lag)
+            print(f"{name}: cold start {cold_start:.2f}s, {stats.summary()} max={max(lags, default=0) * 1000:.0f}ms")
+    finally:
+        shutil.rmtree(profile_dir, ignore_errors=True)
@@ -0,0 +1,282 @@
+import argparse
+import json
+import logging
+import sys
+import time
+
+import multiprocessing
+import chess
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+from browser_profile import create_chrome_options, get_debugger_address, load_browser_session, reattach_browser, save_browser_session
+from engines.engine_host import EngineHost, engine_parameters
+from log_pipeline import ContextFilter, setup_logging
+from shared_state import SharedState, NO_MATE
+from stockfish_bot import StockfishBot
+
+# Runs the bot without the GUI: no Tk, no PyQt5 overlay and no window.
+# The options are the ones of the GUI Start button, read from a JSON
+# config file whose keys are the flag names (with underscores) and then
+# overridden by the flags. The moves, search infos and game results are
+# streamed as JSON lines to stdout or to a file, the logs go to stderr
+# Ex. python daemon.py --stockfish ./stockfish --website lichess --mouseless --headless
+# Ex. python daemon.py --config daemon.json --output games.jsonl
+
+# Messages of the bot that stop it
+ERRORS = {
+    "ERR_EXE": "Stockfish path provided is not valid",
+    "ERR_PERM": "Stockfish path provided is not executable",
+    "ERR_BOARD": "Cant find board",
+    "ERR_COLOR": "Cant find player color",
+    "ERR_MOVES": "Cant find moves list",
+    "ERR_GAMEOVER": "Game has already finished",
+}
+
+# Seconds between two attempts to start the bot with --keep-running
+RETRY_INTERVAL = 2
+
+
+def create_parser():
+    parser = argparse.ArgumentParser(description="Runs the bot without the GUI")
+    parser.add_argument("--config", help="JSON file with the default options")
+    parser.add_argument("--stockfish", help="path of the Stockfish executable")
+    parser.add_argument("--website", choices=("chesscom", "lichess"), default="chesscom")
+    parser.add_argument("--output", help="file the events are appended to (default: stdout)")
+
+    # Engine
+    parser.add_argument("--slow-mover", type=int, default=100)
+    parser.add_argument("--skill-level", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=15)
+    parser.add_argument("--memory", type=int, default=512, help="hash size (MB)")
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--speculation-threads", type=int, default=0)
+
+    # Modes
+    parser.add_argument("--manual", action="store_true")
+    parser.add_argument("--mouseless", action="store_true")
+    parser.add_argument("--input-backend", choices=("pyautogui", "cdp"), default="cdp")
+    parser.add_argument("--screen-grabber", action="store_true")
+    parser.add_argument("--socket-grabber", action="store_true")
+    parser.add_argument("--non-stop-puzzles", action="store_true")
+    parser.add_argument("--early-stop", action="store_true")
+    parser.add_argument("--no-fast-path", dest="fast_path", action="store_false")
+    parser.add_argument("--record", action="store_true")
+    parser.add_argument("--bongcloud", action="store_true")
+    parser.add_argument("--keep-running", action="store_true", help="start the bot again after every game")
+
+    # Browser
+    parser.add_argument("--headless", action="store_true")
+    parser.add_argument("--no-browser-profile", dest="browser_profile", action="store_false")
+    parser.add_argument("--lean-browser", action="store_true")
+    parser.add_argument("--new-browser", action="store_true", help="don't reattach to the browser of the previous run")
+    return parser
+
+
+# Parses the flags over the options of the config file
+def parse_arguments(argv=None):
+    parser = create_parser()
+    arguments, _ = parser.parse_known_args(argv)
+    if arguments.config is not None:
+        with open(arguments.config) as f:
+            config = json.load(f)
+        parser.set_defaults(**{key.replace("-", "_"): value for key, value in config.items()})
+
+    arguments = parser.parse_args(argv)
+    if arguments.stockfish is None:
+        parser.error("the Stockfish path is required (--stockfish or the config file)")
+    return arguments
+
+
+# Writes one event as a JSON line
+# Ex. {"time": 1760868900.12, "event": "move", "game": 1, "ply": 12, "uci": "g1f3", "san": "Nf3"}
+class EventWriter:
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, event, **fields):
+        self.stream.write(json.dumps(dict(time=round(time.time(), 3), event=event, **fields)) + "\n")
+        self.stream.flush()
+
+
+# Reattaches to the browser of the previous run or opens a new one
+# Returns (chrome, chrome_url, debugger_address)
+def open_browser(arguments):
+    session = None if arguments.new_browser else load_browser_session()
+    if session is not None:
+        result = reattach_browser(session)
+        if result is not None:
+            logging.info("Reattached to the browser of the previous run")
+            return result + (session.get("debugger_address"),)
+
+    options = create_chrome_options(arguments.browser_profile, arguments.lean_browser)
+    if arguments.headless:
+        options.add_argument("--headless=new")
+    chromedriver_path = ChromeDriverManager().install()
+    chrome = webdriver.Chrome(service=ChromeService(chromedriver_path), options=options)
+    chrome.get("https://www.chess.com" if arguments.website == "chesscom" else "https://www.lichess.org")
+
+    chrome_url = chrome.service.service_url
+    debugger_address = get_debugger_address(chrome)
+    save_browser_session(chrome_url, chrome.session_id, debugger_address, chromedriver_path, arguments.website)
+    return chrome, chrome_url, debugger_address
+
+
+class Daemon:
+    def __init__(self, arguments, events, log_queue, session_id):
+        self.arguments = arguments
+        self.events = events
+        self.log_queue = log_queue
+        self.session_id = session_id
+        self.game_id = 0
+
+        self.state = SharedState(["daemon"])
+        self.engine_pipe = None
+        self.engine_host = None
+        self.chrome = None
+        self.chrome_url = None
+        self.chrome_debugger_address = None
+        self.bot = None
+        self.bot_pipe = None
+        self.start_time = None
+
+    def start_engine_host(self):
+        arguments = self.arguments
+        parameters = engine_parameters(arguments.slow_mover, arguments.skill_level, arguments.memory, arguments.threads)
+        self.engine_pipe, child_conn = multiprocessing.Pipe()
+        self.engine_host = EngineHost(
+            child_conn, arguments.stockfish, arguments.depth, parameters, self.log_queue, ContextFilter(self.session_id)
+        )
+        self.engine_host.start()
+
+    def start_bot(self):
+        arguments = self.arguments
+        self.game_id += 1
+        self.bot_pipe, child_conn = multiprocessing.Pipe()
+        self.bot = StockfishBot(
+            self.chrome_url,
+            self.chrome.session_id,
+            self.chrome_debugger_address,
+            arguments.website,
+            child_conn,
+            self.state,
+            self.engine_pipe,
+            arguments.manual,
+            arguments.mouseless,
+            arguments.input_backend,
+            arguments.screen_grabber,
+            arguments.socket_grabber,
+            arguments.non_stop_puzzles,
+            arguments.early_stop,
+            arguments.fast_path,
+            arguments.record,
+            arguments.bongcloud,
+            arguments.slow_mover,
+            arguments.skill_level,
+            arguments.depth,
+            arguments.memory,
+            arguments.threads,
+            arguments.speculation_threads,
+            None,
+            self.log_queue,
+            ContextFilter(self.session_id, self.game_id),
+        )
+        self.start_time = time.perf_counter()
+        self.bot.start()
+
+    # Reads the bot messages until it exits
+    # Returns True if the bot asked to be started again (non-stop puzzles)
+    def wait_for_bot(self):
+        restart = False
+        game_id = None
+        board = chess.Board()
+        last_info = None
+        while True:
+            # Read once more after the bot exited for its last moves
+            running = self.bot.is_alive()
+            while self.bot_pipe.poll():
+                try:
+                    message = self.bot_pipe.recv()
+                except EOFError:
+                    break
+                if message == "START":
+                    self.events.write("start", game=self.game_id, latency=round(time.perf_counter() - self.start_time, 3))
+                elif message[:7] == "RESTART":
+                    restart = True
+                    self.bot_pipe.send("DELETE")
+                elif message in ERRORS:
+                    self.events.write("error", game=self.game_id, code=message, message=ERRORS[message])
+
+            if self.state.wait("daemon", 0.1):
+                # Stream the new moves like the GUI move list
+                if self.state.get_game_id() != game_id:
+                    game_id, moves = self.state.get_moves()
+                    board = chess.Board()
+                else:
+                    game_id, moves = self.state.get_moves(len(board.move_stack))
+                for move in moves:
+                    self.events.write("move", game=self.game_id, ply=len(board.move_stack) + 1, uci=move.uci(), san=board.san(move))
+                    board.push(move)
+
+                depth, cp, mate, pv = self.state.get_search_info()
+                info = (depth, cp, mate, [move.uci() for move in pv])
+                if depth and info != last_info:
+                    last_info = info
+                    self.events.write(
+                        "search", game=self.game_id, depth=depth, cp=cp, mate=None if mate == NO_MATE else mate, pv=info[3]
+                    )
+
+            if not running:
+                break
+
+        outcome = board.outcome(claim_draw=True)
+        self.events.write(
+            "game_over",
+            game=self.game_id,
+            plies=len(board.move_stack),
+            result=outcome.result() if outcome is not None else None,
+            duration=round(time.perf_counter() - self.start_time, 3),
+        )
+        return restart
+
+    def run(self):
+        self.start_engine_host()
+        self.chrome, self.chrome_url, self.chrome_debugger_address = open_browser(self.arguments)
+        self.events.write("browser", url=self.chrome.current_url)
+
+        while True:
+            self.start_bot()
+            restart = self.wait_for_bot()
+            if not restart and not self.arguments.keep_running:
+                break
+            if not restart:
+                time.sleep(RETRY_INTERVAL)
+
+    def stop(self):
+        if self.bot is not None and self.bot.is_alive():
+            self.bot.kill()
+        if self.engine_host is not None:
+            self.engine_host.kill()
+        self.state.close()
+        self.state.unlink()
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+
+    session_id = time.strftime("%Y%m%d-%H%M%S")
+    log_queue = multiprocessing.Queue()
+    log_listener = setup_logging(log_queue, ContextFilter(session_id), sys.stderr)
+
+    output = open(arguments.output, "a") if arguments.output else sys.stdout
+    daemon = Daemon(arguments, EventWriter(output), log_queue, session_id)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        daemon.stop()
+        log_listener.stop()
+        if output is not sys.stdout:
+            output.close()
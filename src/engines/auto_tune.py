@@ -0,0 +1,124 @@
+import json
+import os
+import platform
+
+# Positions searched for every Threads/Hash combination:
+# the opening, two middlegames and an endgame
+TUNE_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP3PPP/R2QKB1R w KQ - 0 9",
+    "r2q1rk1/1b2bppp/p2ppn2/1p6/3NP3/1BN1B3/PPP2PPP/R2Q1RK1 w - - 0 12",
+    "8/5pk1/6p1/3P4/4K3/8/5PPP/8 w - - 0 40",
+]
+
+# Depth of the searches, deep enough for the threads to pay off
+TUNE_DEPTH = 16
+
+# Cores left for Chrome and for the GUI, bot and overlay processes
+RESERVED_CORES = 2
+
+HASH_SIZES = [64, 256, 1024]
+
+# A setting at most this much slower than the fastest one is preferred
+# if it uses fewer threads or less memory
+TOLERANCE = 0.05
+
+TUNE_FILE = "auto_tune.json"
+
+
+# Returns the number of cores the engine can use
+def available_cores():
+    if hasattr(os, "sched_getaffinity"):
+        cores = len(os.sched_getaffinity(0))
+    else:
+        cores = os.cpu_count() or 1
+    return max(1, cores - RESERVED_CORES)
+
+
+# Ex. 6 cores -> [1, 2, 4, 6]
+def thread_candidates(cores):
+    candidates = []
+    threads = 1
+    while threads < cores:
+        candidates.append(threads)
+        threads *= 2
+    candidates.append(cores)
+    return candidates
+
+
+# Returns the hash sizes (MB) that use at most a quarter of the memory
+def hash_candidates():
+    try:
+        memory = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return HASH_SIZES
+    return [size for size in HASH_SIZES if size <= memory // 4] or HASH_SIZES[:1]
+
+
+# Identifies the machine and the engine binary, so the stored
+# setting is not reused with another computer or Stockfish version
+def tune_key(stockfish_path):
+    stat = os.stat(stockfish_path)
+    return f"{platform.node()}|{os.cpu_count()}|{os.path.abspath(stockfish_path)}|{stat.st_size}|{int(stat.st_mtime)}"
+
+
+# Returns the fastest setting, or a cheaper one that is almost as fast
+def pick_best(results):
+    fastest = min(result["time"] for result in results)
+    candidates = [result for result in results if result["time"] <= fastest * (1 + TOLERANCE)]
+    return min(candidates, key=lambda result: (result["threads"], result["hash"], result["time"]))
+
+
+# Searches the tune positions to TUNE_DEPTH with every Threads/Hash
+# combination through the engine host and returns the best one. The
+# depth is fixed so the stored results of a machine can be compared
+# Returns {"threads", "hash", "time", "nps", "results"} where time is the
+# total time to depth and nps the average nodes per second
+def auto_tune(engine, on_progress=None):
+    combinations = [(threads, size) for threads in thread_candidates(available_cores()) for size in hash_candidates()]
+
+    results = []
+    for i, (threads, size) in enumerate(combinations):
+        engine.configure(TUNE_DEPTH, {"Threads": threads, "Hash": size})
+
+        total_time = 0.0
+        nps = []
+        for fen in TUNE_POSITIONS:
+            # Starts a new game, so the hash of the previous position is not used
+            engine.set_fen_position(fen)
+            last_info = {}
+            result = engine.search(on_info=last_info.update, depth=TUNE_DEPTH)
+            total_time += result["elapsed"]
+            nps.append(last_info.get("nps", 0))
+
+        results.append({"threads": threads, "hash": size, "time": total_time, "nps": sum(nps) // len(nps)})
+        if on_progress is not None:
+            on_progress(i + 1, len(combinations), results[-1])
+
+    best = dict(pick_best(results))
+    best["results"] = results
+    return best
+
+
+def load_tune_file():
+    try:
+        with open(TUNE_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+# Returns the stored {"threads", "hash", ...} for this machine and engine, or None
+def load_tuned_parameters(stockfish_path):
+    try:
+        key = tune_key(stockfish_path)
+    except OSError:
+        return None
+    return load_tune_file().get(key)
+
+
+def save_tuned_parameters(stockfish_path, best):
+    tuned = load_tune_file()
+    tuned[tune_key(stockfish_path)] = {"threads": best["threads"], "hash": best["hash"], "time": best["time"], "nps": best["nps"]}
+    with open(TUNE_FILE, "w") as f:
+        json.dump(tuned, f, indent=2)
@@ -0,0 +1,470 @@
+import logging
+import os
+import threading
+import time
+from itertools import count
+
+import multiprocess
+from stockfish import Stockfish
+from stockfish.models import StockfishException
+
+from engines.speculation import Speculator
+from log_pipeline import setup_process_logging
+
+
+# Builds the Stockfish UCI options from the GUI values
+def engine_parameters(slow_mover, skill_level, memory, cpu_threads):
+    return {
+        "Threads": cpu_threads,
+        "Hash": memory,
+        "Ponder": "true",
+        "Slow Mover": slow_mover,
+        "Skill Level": skill_level
+    }
+
+
+# Options used to stop the search once the best move stabilizes:
+# the best move has to stay the same for stable_iterations depths with
+# the score moving at most score_margin centipawns, and the search runs
+# between min_time and max_time seconds
+EARLY_STOP = {
+    "stable_iterations": 4,
+    "score_margin": 30,
+    "min_time": 0.1,
+    "max_time": 10,
+}
+
+# Score used for comparing mate scores with centipawn scores
+MATE_SCORE = 100000
+
+# standby: keep a second engine with the same options and position to
+# switch to when the engine crashes or hangs (it uses as much memory)
+# silence_timeout: seconds a busy engine can go without printing anything
+# before it is considered hung and killed. Stockfish prints a currmove
+# line every second in long searches
+# check_interval: seconds between two health checks
+WATCHDOG = {
+    "standby": True,
+    "silence_timeout": 10,
+    "check_interval": 0.5,
+}
+
+# Raised by python-stockfish when the engine process died or its pipes closed
+ENGINE_FAILURES = (StockfishException, BrokenPipeError, OSError)
+
+# Requests that set the position, replayed on the standby engine
+POSITION_METHODS = ("set_position", "set_fen_position", "make_moves_from_current_position")
+
+
+# Sets the start position and the moves played from it in one "position"
+# command, so the engine sees the game history and the repetitions
+# (python-stockfish sends every move from the FEN of the previous one)
+# Ex. set_game_position(engine, None, ["e2e4", "e7e5"], False)
+def set_game_position(engine, fen, moves, new_game):
+    engine._prepare_for_new_position(new_game)
+    command = f"position fen {fen}" if fen else "position startpos"
+    if moves:
+        command += " moves " + " ".join(moves)
+    engine._put(command)
+
+
+# Sets a position request on the engine
+def apply_position(engine, method, args):
+    if method == "set_game_position":
+        set_game_position(engine, *args)
+    else:
+        getattr(engine, method)(*args)
+
+
+# Parses a Stockfish "info" line with a principal variation
+# Ex. "info depth 12 seldepth 16 multipv 1 score cp 35 nodes 9000 nps 900000 time 10 pv e2e4 e7e5"
+# Returns {"depth": 12, "cp": 35, "mate": None, "nps": 900000, "pv": ["e2e4", "e7e5"]} or None
+def parse_info(line):
+    tokens = line.split()
+    if not tokens or tokens[0] != "info" or "pv" not in tokens or "lowerbound" in tokens or "upperbound" in tokens:
+        return None
+
+    info = {"depth": 0, "cp": None, "mate": None, "nps": 0, "pv": tokens[tokens.index("pv") + 1:]}
+    for i, token in enumerate(tokens[:-1]):
+        if token in ("depth", "nps"):
+            info[token] = int(tokens[i + 1])
+        elif token == "score" and i + 2 < len(tokens):
+            info[tokens[i + 1]] = int(tokens[i + 2])
+
+    if not info["pv"]:
+        return None
+    return info
+
+
+# Returns the score of an info as centipawns
+def info_score(info):
+    if info["mate"] is not None:
+        return MATE_SCORE - abs(info["mate"]) if info["mate"] > 0 else -MATE_SCORE + abs(info["mate"])
+    return info["cp"] or 0
+
+
+# Estimates how long the search would have taken to reach target_depth
+# from the times at which the last depths were reached
+# Ex. depth_times = [(10, 0.05), (11, 0.09), (12, 0.17)]
+def estimate_time_to_depth(depth_times, target_depth):
+    if len(depth_times) < 3:
+        return depth_times[-1][1] if depth_times else 0.0
+
+    # Average growth of the time between consecutive depths
+    recent = depth_times[-4:]
+    ratios = [b[1] / a[1] for a, b in zip(recent, recent[1:]) if a[1] > 0]
+    ratio = max(1.0, sum(ratios) / len(ratios)) if ratios else 1.0
+    depth, elapsed = depth_times[-1]
+    return elapsed * ratio ** max(0, target_depth - depth)
+
+
+# Raised on the client side when the engine host failed to run a request
+class EngineError(Exception):
+    pass
+
+
+# Keeps a Stockfish instance alive in its own process so that the
+# process spawn, the NNUE load and the hash allocation happen as soon
+# as the Stockfish path is selected and not after Start is pressed.
+# Requests are received through the pipe as (request_id, method, args)
+# tuples and answered with (request_id, kind, payload) tuples, where kind
+# is "result", "error" or "info" (streamed while searching).
+# A watchdog thread kills the engine when it hangs, and a crashed or
+# killed engine is replaced by the standby engine (see WATCHDOG), after
+# which the failed request runs again
+class EngineHost(multiprocess.Process):
+    def __init__(self, pipe, stockfish_path, depth, parameters, log_queue=None, log_context=None):
+        multiprocess.Process.__init__(self)
+        self.daemon = True
+
+        self.pipe = pipe
+        self.stockfish_path = stockfish_path
+        self.depth = depth
+        self.parameters = parameters
+        self.search_depth = depth
+        self.stockfish = None
+        self.speculator = None
+        self.status = "OK"
+        self.log_queue = log_queue
+        self.log_context = log_context
+
+        # The position requests since the last new position, and the
+        # ones the standby engine was set to
+        self.position = []
+        self.standby = None
+        self.standby_position = None
+        self.standby_lock = threading.Lock()
+
+        # Time of the last output of the engine while it runs a request
+        self.busy_since = None
+        self.failovers = 0
+
+    # Applies only the options that differ from the running engine,
+    # so unchanged Threads and Hash values don't reallocate anything
+    def configure(self, depth, parameters):
+        current = self.stockfish.get_parameters()
+        changed = {name: value for name, value in parameters.items() if current.get(name) != value}
+        if changed:
+            self.stockfish.update_engine_parameters(changed)
+        self.parameters = dict(self.parameters, **parameters)
+        self.stockfish.set_depth(depth)
+        self.search_depth = depth
+
+    # Runs "go depth" while sending every info line with a principal
+    # variation to the client. If early_stop is given (see EARLY_STOP),
+    # the search is stopped as soon as the best move is stable
+    # Returns {"move", "depth", "elapsed", "stopped_early", "saved"}
+    # where saved is the estimated time saved by stopping early
+    def search(self, request_id, depth, early_stop):
+        start_time = time.perf_counter()
+        depth_times = []
+        best_move = None
+        best_score = None
+        stable_iterations = 0
+        stopped_early = False
+
+        # The engine may not print anything for a while in deep
+        # searches, so max_time is enforced by a timer
+        timer = None
+        if early_stop is not None:
+            timer = threading.Timer(early_stop["max_time"], self.stockfish._put, args=("stop",))
+            timer.start()
+
+        try:
+            self.stockfish._put(f"go depth {depth}")
+            while True:
+                line = self.stockfish._read_line()
+                self.busy_since = time.perf_counter()
+                if line.startswith("bestmove"):
+                    break
+
+                info = parse_info(line)
+                if info is None:
+                    continue
+                self.pipe.send((request_id, "info", info))
+
+                # Only the first line of every depth counts as an iteration
+                elapsed = time.perf_counter() - start_time
+                if depth_times and info["depth"] <= depth_times[-1][0]:
+                    continue
+                depth_times.append((info["depth"], elapsed))
+
+                score = info_score(info)
+                if info["pv"][0] == best_move and abs(score - best_score) <= (early_stop or EARLY_STOP)["score_margin"]:
+                    stable_iterations += 1
+                else:
+                    stable_iterations = 0
+                best_move = info["pv"][0]
+                best_score = score
+
+                if (
+                    early_stop is not None
+                    and not stopped_early
+                    and stable_iterations >= early_stop["stable_iterations"]
+                    and elapsed >= early_stop["min_time"]
+                    and info["depth"] < depth
+                ):
+                    self.stockfish._put("stop")
+                    stopped_early = True
+        finally:
+            if timer is not None:
+                timer.cancel()
+
+        elapsed = time.perf_counter() - start_time
+        tokens = line.split()
+        move = tokens[1] if len(tokens) > 1 and tokens[1] != "(none)" else None
+        saved = 0.0
+        if stopped_early:
+            saved = max(0.0, estimate_time_to_depth(depth_times, depth) - elapsed)
+
+        return {
+            "move": move,
+            "depth": depth_times[-1][0] if depth_times else 0,
+            "elapsed": elapsed,
+            "stopped_early": stopped_early,
+            "saved": saved,
+        }
+
+    # Starts analyzing the likeliest replies to moves on pool_size
+    # extra engines (see engines.speculation)
+    def speculate(self, moves, pool_size):
+        if self.speculator is not None and len(self.speculator.engines) != pool_size:
+            self.speculator.cancel()
+            for engine in self.speculator.engines:
+                engine._put("quit")
+            self.speculator = None
+
+        if self.speculator is None:
+            self.speculator = Speculator(self.stockfish_path, self.parameters, pool_size)
+        self.speculator.update_parameters(self.parameters)
+        self.speculator.start(moves, self.search_depth)
+
+    def take_speculation(self, moves):
+        if self.speculator is None:
+            return None
+        return self.speculator.take(moves)
+
+    # Spawns an engine with the current options. The Stockfish constructor waits for "readyok"
+    def spawn_engine(self):
+        return Stockfish(path=self.stockfish_path, depth=self.search_depth, parameters=self.parameters)
+
+    # Sets the options and the position of the host on engine, which is
+    # at engine_position (a list of position requests)
+    # Returns the position engine is at
+    def apply_state(self, engine, engine_position):
+        current = engine.get_parameters()
+        changed = {name: value for name, value in self.parameters.items() if current.get(name) != value}
+        if changed:
+            engine.update_engine_parameters(changed)
+        engine.set_depth(self.search_depth)
+
+        position = list(self.position)
+        if position != engine_position:
+            for method, args in position:
+                apply_position(engine, method, args)
+        return position
+
+    # Replaces the crashed or hung engine by the standby engine (a new
+    # engine is spawned if there is none) and sets it to the current position
+    def fail_over(self, error):
+        start_time = time.perf_counter()
+        try:
+            self.stockfish._stockfish.kill()
+        except OSError:
+            pass
+
+        with self.standby_lock:
+            engine, engine_position = self.standby, self.standby_position
+            self.standby = None
+        if engine is None or engine._stockfish.poll() is not None:
+            engine, engine_position = self.spawn_engine(), None
+            source = "new"
+        else:
+            source = "standby"
+        self.apply_state(engine, engine_position)
+        self.stockfish = engine
+
+        self.failovers += 1
+        logging.warning(
+            f"Engine failed ({error!r}), switched to the {source} engine in {(time.perf_counter() - start_time) * 1000:.0f}ms "
+            f"({self.failovers} failovers)"
+        )
+
+    # Kills the engine when it was busy without printing anything for too
+    # long, and keeps the standby engine alive and in sync with the engine
+    def watchdog_thread(self):
+        while True:
+            time.sleep(WATCHDOG["check_interval"])
+
+            busy_since = self.busy_since
+            if busy_since is not None and time.perf_counter() - busy_since > WATCHDOG["silence_timeout"]:
+                logging.error(f"Engine silent for {time.perf_counter() - busy_since:.1f}s, killing it")
+                self.busy_since = None
+                try:
+                    self.stockfish._stockfish.kill()
+                except OSError:
+                    pass
+
+            if not WATCHDOG["standby"]:
+                continue
+            try:
+                with self.standby_lock:
+                    if self.standby is not None and self.standby._stockfish.poll() is not None:
+                        logging.warning("Standby engine exited")
+                        self.standby = None
+                    if self.standby is None:
+                        start_time = time.perf_counter()
+                        self.standby, self.standby_position = self.spawn_engine(), None
+                        logging.info(f"Standby engine spawned in {(time.perf_counter() - start_time) * 1000:.0f}ms")
+                    self.standby_position = self.apply_state(self.standby, self.standby_position)
+            except Exception:
+                logging.exception("Failed to prepare the standby engine")
+                self.standby = None
+
+    def dispatch(self, request_id, method, args):
+        if method == "configure":
+            return self.configure(*args)
+        if method == "search":
+            early_stop, depth = args
+            return self.search(request_id, depth or self.search_depth, early_stop)
+
+        if method == "set_game_position":
+            set_game_position(self.stockfish, *args)
+            self.position = [(method, args)]
+            return None
+
+        result = getattr(self.stockfish, method)(*args)
+        if method == "make_moves_from_current_position":
+            self.position.append((method, args))
+        elif method in POSITION_METHODS:
+            self.position = [(method, args)]
+        return result
+
+    def handle(self, request_id, method, args):
+        if method == "status":
+            return self.status
+        if self.stockfish is None:
+            raise EngineError(self.status)
+        if method == "speculate":
+            return self.speculate(*args)
+        if method == "take_speculation":
+            return self.take_speculation(*args)
+
+        # The request runs again once on the engine that replaced a failed one
+        self.busy_since = time.perf_counter()
+        try:
+            try:
+                return self.dispatch(request_id, method, args)
+            except ENGINE_FAILURES as e:
+                self.fail_over(e)
+                self.busy_since = time.perf_counter()
+                return self.dispatch(request_id, method, args)
+        finally:
+            self.busy_since = None
+
+    def run(self):
+        if self.log_queue is not None:
+            setup_process_logging(self.log_queue, self.log_context)
+
+        try:
+            self.stockfish = self.spawn_engine()
+        except PermissionError:
+            self.status = "ERR_PERM"
+        except OSError:
+            self.status = "ERR_EXE"
+        if self.stockfish is not None:
+            threading.Thread(target=self.watchdog_thread, daemon=True).start()
+
+        while True:
+            try:
+                request_id, method, args = self.pipe.recv()
+            except (EOFError, OSError):
+                # Every end of the pipe was closed
+                return
+
+            try:
+                self.pipe.send((request_id, "result", self.handle(request_id, method, args)))
+            except Exception as e:
+                self.pipe.send((request_id, "error", repr(e)))
+
+
+# Used by the bot process to talk to the engine host
+class EngineClient:
+    def __init__(self, pipe):
+        self.pipe = pipe
+        self.request_ids = count()
+
+    # Sends a request and waits for its result. The info messages
+    # streamed while waiting are passed to on_info
+    def call(self, method, *args, on_info=None):
+        # The pid makes the id unique, so answers meant for
+        # a previous (killed) bot process are skipped
+        request_id = (os.getpid(), next(self.request_ids))
+        self.pipe.send((request_id, method, args))
+        while True:
+            response_id, kind, payload = self.pipe.recv()
+            if response_id != request_id:
+                continue
+            if kind == "info":
+                if on_info is not None:
+                    on_info(payload)
+                continue
+            break
+
+        if kind == "error":
+            raise EngineError(payload)
+        return payload
+
+    # Returns "OK", "ERR_PERM" or "ERR_EXE"
+    def get_status(self):
+        return self.call("status")
+
+    def configure(self, depth, parameters):
+        return self.call("configure", depth, parameters)
+
+    def set_position(self, moves):
+        return self.call("set_position", moves)
+
+    def set_fen_position(self, fen):
+        return self.call("set_fen_position", fen)
+
+    def set_game_position(self, fen, moves, new_game=False):
+        return self.call("set_game_position", fen, moves, new_game)
+
+    def make_moves_from_current_position(self, moves):
+        return self.call("make_moves_from_current_position", moves)
+
+    def get_best_move(self):
+        return self.call("get_best_move")
+
+    # Returns right away, the replies are analyzed in the background
+    def speculate(self, moves, pool_size):
+        return self.call("speculate", moves, pool_size)
+
+    # Returns the speculated best move after moves, or None
+    def take_speculation(self, moves):
+        return self.call("take_speculation", moves)
+
+    # See EngineHost.search. The configured depth is used if depth is None
+    def search(self, early_stop=None, on_info=None, depth=None):
+        return self.call("search", early_stop, depth, on_info=on_info)
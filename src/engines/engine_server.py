@@ -0,0 +1,406 @@
+import argparse
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from itertools import count
+
+import multiprocess
+
+from engines.engine_host import EngineClient, EngineError, EngineHost, engine_parameters
+from log_pipeline import ContextFilter, setup_logging
+from utilities import LatencyStats
+
+# Address of the engine server the bot searches on instead of the local engine
+# Ex. CHESS_BOT_ENGINE_SERVER="192.168.1.20:9010"
+ENGINE_SERVER_ENV_VAR = "CHESS_BOT_ENGINE_SERVER"
+
+DEFAULT_PORT = 9010
+
+# Seconds allowed for connecting to a server
+CONNECT_TIMEOUT = 5
+
+# Seconds between two metrics reports in the log
+REPORT_INTERVAL = 60
+
+# Options set by whoever runs the worker, since they depend on its machine
+WORKER_OPTIONS = ("Threads", "Hash")
+
+
+# Searches on an engine host process of this machine
+class LocalWorker:
+    def __init__(self, name, stockfish_path, depth, parameters, log_queue=None, log_context=None):
+        self.name = name
+        self.depth = depth
+        self.parameters = parameters
+        self.pipe, child_conn = multiprocess.Pipe()
+        self.host = EngineHost(child_conn, stockfish_path, depth, parameters, log_queue, log_context)
+        self.host.start()
+        self.client = EngineClient(self.pipe)
+
+        # The session whose positions are in the engine hash
+        self.session = None
+        self.searches = 0
+        self.busy_time = 0.0
+        self.session_switches = 0
+
+    def get_status(self):
+        return self.client.get_status()
+
+    def search(self, request, on_info):
+        parameters = dict(request.get("parameters") or self.parameters)
+        for name in WORKER_OPTIONS:
+            parameters[name] = self.parameters[name]
+        depth = request.get("depth") or self.depth
+        self.client.configure(depth, parameters)
+
+        # The hash is only cleared when the worker switches to another game
+        new_session = request.get("session") != self.session
+        if new_session:
+            self.session = request.get("session")
+            self.session_switches += 1
+        position = request["position"]
+        self.client.set_game_position(position.get("fen"), position.get("moves", []), new_session)
+        return self.client.search(request.get("early_stop"), on_info, depth)
+
+    def stop(self):
+        self.host.kill()
+
+
+# Forwards the searches to the engine server of another machine, which
+# schedules them on its own workers. One RemoteWorker runs one search at
+# a time, so a server is listed once per search it should run in parallel
+class RemoteWorker:
+    def __init__(self, name, address):
+        self.name = name
+        self.client = RemoteEngineClient(address)
+
+        self.session = None
+        self.searches = 0
+        self.busy_time = 0.0
+        self.session_switches = 0
+
+    def get_status(self):
+        return self.client.get_status()
+
+    def search(self, request, on_info):
+        if request.get("session") != self.session:
+            self.session = request.get("session")
+            self.session_switches += 1
+        fields = {name: value for name, value in request.items() if name not in ("id", "method")}
+        return self.client.call("search", on_info, **fields)
+
+    def stop(self):
+        self.client.close()
+
+
+# Hands the queued searches to the workers. A worker takes the searches
+# of the session (game) it searched last, so its hash stays useful, and
+# the other searches in arrival order unless an idle worker has their session
+class Scheduler:
+    def __init__(self, workers):
+        self.workers = workers
+        self.queue = deque()
+        self.idle = set()
+        self.condition = threading.Condition()
+
+        self.start_time = time.perf_counter()
+        self.completed = 0
+        self.failed = 0
+        self.queue_stats = LatencyStats("queue wait")
+        self.search_stats = LatencyStats("search")
+
+    def start(self):
+        for worker in self.workers:
+            threading.Thread(target=self.worker_thread, args=(worker,), daemon=True).start()
+        threading.Thread(target=self.report_thread, daemon=True).start()
+
+    # Queues a search request
+    # Returns a Future of the search result
+    def submit(self, request, on_info):
+        future = Future()
+        with self.condition:
+            self.queue.append((request, on_info, future, time.perf_counter()))
+            self.condition.notify_all()
+        return future
+
+    def has_idle_worker(self, session, other_than):
+        return any(worker.session == session for worker in self.idle if worker is not other_than)
+
+    def take_job(self, worker):
+        with self.condition:
+            while True:
+                job = next((job for job in self.queue if job[0].get("session") == worker.session), None)
+                if job is None:
+                    job = next((job for job in self.queue if not self.has_idle_worker(job[0].get("session"), worker)), None)
+                if job is not None:
+                    self.queue.remove(job)
+                    self.idle.discard(worker)
+                    return job
+                self.idle.add(worker)
+                self.condition.wait()
+
+    def worker_thread(self, worker):
+        while True:
+            request, on_info, future, submit_time = self.take_job(worker)
+            start_time = time.perf_counter()
+            self.queue_stats.add(start_time - submit_time)
+            try:
+                result = worker.search(request, on_info)
+            except Exception as e:
+                logging.exception(f"Search failed on {worker.name}")
+                self.failed += 1
+                future.set_exception(e)
+                continue
+
+            elapsed = time.perf_counter() - start_time
+            worker.searches += 1
+            worker.busy_time += elapsed
+            self.search_stats.add(elapsed)
+            self.completed += 1
+            future.set_result(result)
+
+    # Returns the throughput, queueing and per worker metrics
+    def get_stats(self):
+        uptime = time.perf_counter() - self.start_time
+        return {
+            "uptime": uptime,
+            "completed": self.completed,
+            "failed": self.failed,
+            "throughput": self.completed / uptime if uptime > 0 else 0.0,
+            "queued": len(self.queue),
+            "queue_wait": self.queue_stats.summary(),
+            "search": self.search_stats.summary(),
+            "workers": {
+                worker.name: {
+                    "searches": worker.searches,
+                    "utilization": worker.busy_time / uptime if uptime > 0 else 0.0,
+                    "session_switches": worker.session_switches,
+                }
+                for worker in self.workers
+            },
+        }
+
+    def report_thread(self):
+        reported = None
+        while True:
+            time.sleep(REPORT_INTERVAL)
+            if self.completed == reported:
+                continue
+            reported = self.completed
+            stats = self.get_stats()
+            logging.info(
+                f"engine server: {stats['completed']} searches ({stats['throughput']:.2f}/s), "
+                f"{stats['queued']} queued, {stats['queue_wait']}, {stats['search']}"
+            )
+            for name, worker in stats["workers"].items():
+                logging.info(f"worker {name}: {worker['searches']} searches, {worker['utilization']:.0%} busy, {worker['session_switches']} session switches")
+
+
+# Serves the requests of one connection, one JSON object per line:
+# {"id": 1, "method": "search", "position": {"fen": null, "moves": ["e2e4"]},
+#  "depth": 15, "early_stop": null, "parameters": {...}, "session": "..."}
+# answered like the engine host pipe with {"id", "kind", "payload"} lines,
+# where kind is "info" (streamed while searching), "result" or "error"
+class RequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.write_lock = threading.Lock()
+
+    def send(self, request_id, kind, payload):
+        line = json.dumps({"id": request_id, "kind": kind, "payload": payload}) + "\n"
+        with self.write_lock:
+            self.wfile.write(line.encode())
+            self.wfile.flush()
+
+    def handle(self):
+        scheduler = self.server.scheduler
+        for line in self.rfile:
+            request = json.loads(line)
+            request_id = request.get("id")
+            try:
+                method = request["method"]
+                if method == "status":
+                    result = self.server.status
+                elif method == "stats":
+                    result = scheduler.get_stats()
+                elif method == "search":
+                    on_info = lambda info: self.send(request_id, "info", info)
+                    result = scheduler.submit(request, on_info).result()
+                else:
+                    raise EngineError(f"unknown method {method}")
+            except Exception as e:
+                self.send(request_id, "error", repr(e))
+            else:
+                self.send(request_id, "result", result)
+
+
+class EngineServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address, workers):
+        super().__init__(address, RequestHandler)
+        self.workers = workers
+        self.scheduler = Scheduler(workers)
+
+        # The server is usable if one of its workers is
+        statuses = [worker.get_status() for worker in workers]
+        self.status = "OK" if "OK" in statuses else statuses[0]
+        for worker, status in zip(workers, statuses):
+            logging.info(f"worker {worker.name}: {status}")
+        self.scheduler.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        for worker in self.workers:
+            worker.stop()
+
+
+# Used by the bot in place of EngineClient to search on an engine server.
+# The position and the options are kept here and sent with every search,
+# so any worker can run it
+class RemoteEngineClient:
+    def __init__(self, address, session=None):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.session = session or f"{socket.gethostname()}-{os.getpid()}-{id(self)}"
+        self.connection = None
+        self.file = None
+        self.request_ids = count()
+
+        self.depth = None
+        self.parameters = None
+        self.fen = None
+        self.moves = []
+
+    def connect(self):
+        if self.connection is None:
+            self.connection = socket.create_connection(self.address, timeout=CONNECT_TIMEOUT)
+            self.connection.settimeout(None)
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            self.file = self.connection.makefile("rw", encoding="utf-8", newline="\n")
+
+    def close(self):
+        if self.connection is not None:
+            self.file.close()
+            self.connection.close()
+            self.connection = None
+
+    # Sends a request and waits for its result. The info messages
+    # streamed while waiting are passed to on_info
+    def call(self, method, on_info=None, **fields):
+        self.connect()
+        request_id = next(self.request_ids)
+        self.file.write(json.dumps(dict(fields, id=request_id, method=method)) + "\n")
+        self.file.flush()
+        while True:
+            line = self.file.readline()
+            if not line:
+                self.close()
+                raise EngineError("the engine server closed the connection")
+            response = json.loads(line)
+            if response["id"] != request_id:
+                continue
+            if response["kind"] == "info":
+                if on_info is not None:
+                    on_info(response["payload"])
+                continue
+            break
+
+        if response["kind"] == "error":
+            raise EngineError(response["payload"])
+        return response["payload"]
+
+    # Returns "OK", or the error of the workers ("ERR_EXE" if the server can't be reached)
+    def get_status(self):
+        try:
+            return self.call("status")
+        except OSError:
+            logging.exception(f"Can't reach the engine server {self.address[0]}:{self.address[1]}")
+            return "ERR_EXE"
+
+    def get_stats(self):
+        return self.call("stats")
+
+    def configure(self, depth, parameters):
+        self.depth = depth
+        self.parameters = parameters
+
+    def set_position(self, moves):
+        self.fen = None
+        self.moves = list(moves or [])
+
+    def set_fen_position(self, fen):
+        self.fen = fen
+        self.moves = []
+
+    def make_moves_from_current_position(self, moves):
+        self.moves.extend(moves or [])
+
+    def get_best_move(self):
+        return self.search()["move"]
+
+    # The speculation only runs on the local engine host
+    def speculate(self, moves, pool_size):
+        return None
+
+    def take_speculation(self, moves):
+        return None
+
+    # See EngineHost.search
+    def search(self, early_stop=None, on_info=None, depth=None):
+        return self.call(
+            "search",
+            on_info,
+            position={"fen": self.fen, "moves": self.moves},
+            depth=depth or self.depth,
+            early_stop=early_stop,
+            parameters=self.parameters,
+            session=self.session,
+        )
+
+
+# Runs an engine server with local workers and workers on other machines
+# Ex. python -m engines.engine_server stockfish --local 2 --threads 2 --hash 256
+# Ex. python -m engines.engine_server stockfish --local 1 --worker 192.168.1.21:9010 --worker 192.168.1.21:9010
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serves engine searches over TCP")
+    parser.add_argument("stockfish", nargs="?", help="Stockfish path of the local workers")
+    parser.add_argument("--host", default="127.0.0.1", help="0.0.0.0 to accept the LAN")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--local", type=int, default=1, help="number of local workers")
+    parser.add_argument("--worker", action="append", default=[], help="address of an engine server used as a worker")
+    parser.add_argument("--depth", type=int, default=15)
+    parser.add_argument("--threads", type=int, default=1, help="threads of every local worker")
+    parser.add_argument("--hash", type=int, default=256, help="hash (MB) of every local worker")
+    arguments = parser.parse_args()
+    if arguments.stockfish is None and arguments.local > 0:
+        parser.error("the Stockfish path is required for the local workers")
+
+    session_id = "engine-server-" + time.strftime("%Y%m%d-%H%M%S")
+    log_queue = multiprocess.Queue()
+    log_listener = setup_logging(log_queue, ContextFilter(session_id))
+
+    parameters = engine_parameters(100, 20, arguments.hash, arguments.threads)
+    workers = [
+        LocalWorker(f"local-{i + 1}", arguments.stockfish, arguments.depth, parameters, log_queue, ContextFilter(session_id))
+        for i in range(arguments.local)
+    ]
+    workers += [RemoteWorker(f"{address}#{i + 1}", address) for i, address in enumerate(arguments.worker)]
+    server = EngineServer((arguments.host, arguments.port), workers)
+    logging.info(f"Engine server listening on {arguments.host}:{arguments.port} with {len(workers)} workers")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+        log_listener.stop()
@@ -0,0 +1,161 @@
+import argparse
+import bz2
+import csv
+import gzip
+import io
+import mmap
+import os
+import struct
+import sys
+import time
+
+import chess
+import chess.polyglot
+
+# Built from the lichess puzzle database (https://database.lichess.org/#puzzles)
+PUZZLE_INDEX_FILE = "puzzle_index.bin"
+
+# "PZIX", version, number of records
+HEADER = struct.Struct("<4sIQ")
+MAGIC = b"PZIX"
+VERSION = 1
+
+# Zobrist hash of the position and the solution move played in it,
+# sorted by hash so a lookup is a binary search in the mapped file
+RECORD = struct.Struct("<QH")
+
+
+# Packs a move in 16 bits: from square, to square and promotion piece type
+# Ex. e7e8q -> 52 | 60 << 6 | 5 << 12
+def encode_move(move):
+    return move.from_square | move.to_square << 6 | (move.promotion or 0) << 12
+
+
+def decode_move(value):
+    return chess.Move(value & 63, value >> 6 & 63, value >> 12 or None)
+
+
+# Returns the (hash, move) pairs of the positions where the solver plays.
+# The FEN of the database is the position before the opponent move that
+# starts the puzzle, then the solver and the opponent moves alternate
+# Ex. "r6k/pp2r2p/4Rp1Q/3p4/8/1N1P2R1/PqP2bPP/7K b - - 0 24", "f2g3 e6e7 b2b1 b3c1 b1c1 h6c1"
+def solution_records(fen, moves):
+    board = chess.Board(fen)
+    records = []
+    for ply, uci in enumerate(moves.split()):
+        move = chess.Move.from_uci(uci)
+        if ply % 2 == 1:
+            records.append((chess.polyglot.zobrist_hash(board), encode_move(move)))
+        board.push(move)
+    return records
+
+
+def open_csv(path):
+    if path == "-":
+        return io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8")
+    if path.endswith(".bz2"):
+        return bz2.open(path, "rt", encoding="utf-8")
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    return open(path, encoding="utf-8")
+
+
+# Builds the index from the puzzle CSV (plain, .gz, .bz2 or "-" for stdin,
+# Ex. zstdcat lichess_db_puzzle.csv.zst | python -m engines.puzzle_index -).
+# A position with different solutions in two puzzles is left out, so the
+# engine decides there
+# Returns the number of positions written
+def build_index(csv_path, index_path=PUZZLE_INDEX_FILE, min_rating=0, on_progress=None):
+    keys = []
+    with open_csv(csv_path) as f:
+        for count, row in enumerate(csv.DictReader(f), 1):
+            if int(row["Rating"]) < min_rating:
+                continue
+            keys.extend(zobrist_hash << 16 | move for zobrist_hash, move in solution_records(row["FEN"], row["Moves"]))
+            if on_progress is not None and count % 100000 == 0:
+                on_progress(count)
+
+    keys.sort()
+    records = []
+    for key in keys:
+        zobrist_hash, move = key >> 16, key & 0xFFFF
+        if records and records[-1][0] == zobrist_hash:
+            if records[-1][1] != move:
+                records[-1] = (zobrist_hash, None)
+            continue
+        records.append((zobrist_hash, move))
+    records = [record for record in records if record[1] is not None]
+
+    # Written next to the index, then renamed over it, so a running
+    # bot never maps a half written file
+    temporary_path = index_path + ".tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(records)))
+        for zobrist_hash, move in records:
+            f.write(RECORD.pack(zobrist_hash, move))
+    os.replace(temporary_path, index_path)
+    return len(records)
+
+
+# Read-only view of the index. The file is memory mapped, so opening it
+# doesn't read it and a lookup only touches the pages of its binary search
+class PuzzleIndex:
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count = HEADER.unpack_from(self.buffer, 0)
+        if magic != MAGIC or version != VERSION:
+            self.buffer.close()
+            raise ValueError(f"{path} is not a puzzle index (version {VERSION})")
+
+    def get_hash(self, index):
+        return struct.unpack_from("<Q", self.buffer, HEADER.size + index * RECORD.size)[0]
+
+    # Returns the solution move (UCI) of the position, or None
+    def lookup(self, board):
+        zobrist_hash = chess.polyglot.zobrist_hash(board)
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.get_hash(middle) < zobrist_hash:
+                low = middle + 1
+            else:
+                high = middle
+        if low == self.count or self.get_hash(low) != zobrist_hash:
+            return None
+
+        move = decode_move(RECORD.unpack_from(self.buffer, HEADER.size + low * RECORD.size)[1])
+        return move.uci() if board.is_legal(move) else None
+
+    def close(self):
+        self.buffer.close()
+
+
+# Returns the PuzzleIndex, or None if it wasn't built
+def load_puzzle_index(path=PUZZLE_INDEX_FILE):
+    if not os.path.exists(path):
+        return None
+    try:
+        return PuzzleIndex(path)
+    except (OSError, ValueError):
+        return None
+
+
+# Ex. python -m engines.puzzle_index lichess_db_puzzle.csv
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Builds the puzzle solution index from the lichess puzzle CSV")
+    parser.add_argument("csv", help='puzzle CSV (plain, .gz or .bz2), "-" for stdin')
+    parser.add_argument("--output", default=PUZZLE_INDEX_FILE)
+    parser.add_argument("--min-rating", type=int, default=0)
+    arguments = parser.parse_args()
+
+    start_time = time.perf_counter()
+    count = build_index(
+        arguments.csv, arguments.output, arguments.min_rating, lambda puzzles: print(f"{puzzles} puzzles read", flush=True)
+    )
+    print(f"{count} positions written to {arguments.output} in {time.perf_counter() - start_time:.1f}s")
+
+    start_time = time.perf_counter()
+    index = PuzzleIndex(arguments.output)
+    print(f"index opened in {(time.perf_counter() - start_time) * 1000:.2f}ms")
+    index.close()
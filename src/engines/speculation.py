@@ -0,0 +1,135 @@
+import threading
+from collections import deque
+
+from stockfish import Stockfish
+
+# replies: how many of the likeliest opponent replies are analyzed
+# multipv_depth: depth of the MultiPV search that finds them
+# hash: hash size (MB) of every pool engine
+SPECULATION = {
+    "replies": 4,
+    "multipv_depth": 10,
+    "hash": 32,
+}
+
+
+# Reads the output of a "go" command sent to a pool engine and returns
+# the last principal variation of every MultiPV line, best line first
+# Ex. [["e7e5", "g1f3"], ["c7c5"]]
+def read_search(engine):
+    lines = {}
+    while True:
+        tokens = engine._read_line().split()
+        if not tokens:
+            continue
+        if tokens[0] == "bestmove":
+            break
+        if tokens[0] != "info" or "pv" not in tokens or "lowerbound" in tokens or "upperbound" in tokens:
+            continue
+
+        multipv = int(tokens[tokens.index("multipv") + 1]) if "multipv" in tokens else 1
+        lines[multipv] = tokens[tokens.index("pv") + 1:]
+
+    if tokens[1:] and tokens[1] == "(none)":
+        return []
+    return [lines[multipv] for multipv in sorted(lines)]
+
+
+# Analyzes the likeliest opponent replies while the bot waits for the
+# opponent, so the answer to a predicted reply is ready when it is played.
+# A MultiPV search finds the top replies, then every resulting position is
+# searched to the full depth on a pool of single threaded engines, one
+# thread per engine. The pool size is the CPU budget of the speculation
+class Speculator:
+    def __init__(self, stockfish_path, parameters, pool_size):
+        parameters = dict(parameters, Threads=1, Hash=SPECULATION["hash"])
+        self.engines = [Stockfish(path=stockfish_path, parameters=parameters) for _ in range(pool_size)]
+        self.parameters = parameters
+
+        self.moves = None
+        self.table = {}
+        self.lock = threading.Lock()
+        self.cancelled = threading.Event()
+        self.busy = set()
+        self.threads = []
+
+    def update_parameters(self, parameters):
+        parameters = dict(parameters, Threads=1, Hash=SPECULATION["hash"])
+        changed = {name: value for name, value in parameters.items() if self.parameters.get(name) != value}
+        if changed:
+            for engine in self.engines:
+                engine.update_engine_parameters(changed)
+            self.parameters = parameters
+
+    # Starts speculating on the position after moves (UCI, from the starting position)
+    def start(self, moves, depth):
+        self.cancel()
+        self.moves = list(moves)
+        self.table = {}
+        self.cancelled = threading.Event()
+
+        thread = threading.Thread(target=self.speculate, args=(self.moves, depth, self.cancelled), daemon=True)
+        self.threads = [thread]
+        thread.start()
+
+    def speculate(self, moves, depth, cancelled):
+        # Find the likeliest replies with a shallow MultiPV search
+        engine = self.engines[0]
+        with self.lock:
+            if cancelled.is_set():
+                return
+            engine._set_option("MultiPV", SPECULATION["replies"])
+            engine._put("position startpos moves " + " ".join(moves))
+            engine._put(f"go depth {SPECULATION['multipv_depth']}")
+            self.busy.add(engine)
+        lines = read_search(engine)
+        engine._set_option("MultiPV", 1)
+        with self.lock:
+            self.busy.discard(engine)
+
+        replies = deque(line[0] for line in lines)
+        workers = [
+            threading.Thread(target=self.analyze_replies, args=(engine, moves, replies, depth, cancelled), daemon=True)
+            for engine in self.engines
+        ]
+        self.threads.extend(workers)
+        for worker in workers:
+            worker.start()
+
+    # Searches the positions after the replies until there are none left
+    def analyze_replies(self, engine, moves, replies, depth, cancelled):
+        while True:
+            with self.lock:
+                if cancelled.is_set() or not replies:
+                    return
+                reply = replies.popleft()
+                engine._put("position startpos moves " + " ".join(moves + [reply]))
+                engine._put(f"go depth {depth}")
+                self.busy.add(engine)
+
+            lines = read_search(engine)
+            with self.lock:
+                self.busy.discard(engine)
+                # A stopped search didn't reach the depth
+                if not cancelled.is_set() and lines:
+                    self.table[reply] = lines[0][0]
+
+    # Stops the running searches and waits for the threads. The searches
+    # are started with the lock held, so none starts after the stop
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            for engine in self.busy:
+                engine._put("stop")
+
+        # The first thread adds the workers before it ends
+        while self.threads:
+            self.threads.pop(0).join()
+
+    # Returns the best move after moves if it was speculated, or None.
+    # The speculation is over either way, so it is cancelled
+    def take(self, moves):
+        self.cancel()
+        if not moves or self.moves is None or list(moves[:-1]) != self.moves:
+            return None
+        return self.table.get(moves[-1])
@@ -0,0 +1,171 @@
+import glob
+import json
+import os
+import sys
+import time
+
+import chess
+import numpy as np
+from PIL import Image
+
+from utilities import LatencyStats
+
+# Every board image is scaled to this size, so one square is 32x32 pixels
+BOARD_SIZE = 256
+SQUARE_SIZE = BOARD_SIZE // 8
+
+# Frame capture to detected move latency that the recognizer has to stay under
+FRAME_TO_MOVE_TARGET = 0.05
+
+# Minimum difference from the square background for a pixel to be part of a piece
+FOREGROUND_THRESHOLD = 12
+
+# Square labels: 0 is empty, 1-6 are the white pieces and 7-12 the black pieces
+EMPTY = 0
+LABELS_NUM = 13
+
+
+def piece_label(piece):
+    if piece is None:
+        return EMPTY
+    return piece.piece_type + (0 if piece.color == chess.WHITE else 6)
+
+
+# Maps the image squares (row by row from the top left) to the chess squares
+def square_order(is_white):
+    if is_white:
+        return np.array([chess.square(col, 7 - row) for row in range(8) for col in range(8)])
+    return np.array([chess.square(7 - col, row) for row in range(8) for col in range(8)])
+
+
+# Returns an array with the label of every chess square
+def board_labels(board):
+    labels = np.zeros(64, dtype=np.int8)
+    for square, piece in board.piece_map().items():
+        labels[square] = piece_label(piece)
+    return labels
+
+
+# Turns labels into 0 (empty), 1 (white) and 2 (black)
+def occupancy(labels):
+    return np.where(labels == EMPTY, 0, np.where(labels <= 6, 1, 2))
+
+
+# Returns a (64, 64) array with one feature vector per image square.
+# The pixels that differ from the square background (median of its
+# border) are marked +1 if they are light and -1 if they are dark, and
+# the center of the square is scaled down to 8x8. This way highlighted
+# squares look like regular ones
+def square_features(image):
+    gray = np.asarray(image.convert("L").resize((BOARD_SIZE, BOARD_SIZE)), dtype=np.float32)
+    squares = gray.reshape(8, SQUARE_SIZE, 8, SQUARE_SIZE).transpose(0, 2, 1, 3).reshape(64, SQUARE_SIZE, SQUARE_SIZE)
+
+    border = np.concatenate([squares[:, 1, :], squares[:, -2, :], squares[:, :, 1], squares[:, :, -2]], axis=1)
+    background = np.median(border, axis=1)
+
+    center = squares[:, 4:28, 4:28]
+    foreground = np.abs(center - background[:, None, None]) > FOREGROUND_THRESHOLD
+    signed = np.where(foreground, np.where(center > 127, 1.0, -1.0), 0.0)
+    return signed.reshape(64, 8, 3, 8, 3).mean(axis=(2, 4)).reshape(64, 64)
+
+
+# Classifies the board squares by matching them against templates
+# learned from a frame of a known position
+class BoardRecognizer:
+    def __init__(self, is_white):
+        self.order = square_order(is_white)
+        self.templates = np.zeros((LABELS_NUM, 64), dtype=np.float32)
+        self.known = np.zeros(LABELS_NUM, dtype=bool)
+        self.classify_stats = LatencyStats("screen[classify]")
+
+    # Builds the piece set cache from an image of the given board
+    def calibrate(self, image, board):
+        features = square_features(image)
+        labels = board_labels(board)[self.order]
+        for label in range(LABELS_NUM):
+            mask = labels == label
+            self.known[label] = mask.any()
+            if self.known[label]:
+                self.templates[label] = features[mask].mean(axis=0)
+
+    # Returns the labels of the chess squares in the image
+    def classify(self, image):
+        start_time = time.perf_counter()
+
+        features = square_features(image)
+        distances = ((features[:, None, :] - self.templates[None, :, :]) ** 2).sum(axis=2)
+        distances[:, ~self.known] = np.inf
+        labels = np.empty(64, dtype=np.int8)
+        labels[self.order] = distances.argmin(axis=1)
+
+        self.classify_stats.add(time.perf_counter() - start_time)
+        return labels
+
+    # Returns the legal move that turns the board into the
+    # recognized labels, or None if there is no such move
+    @staticmethod
+    def find_move(board, labels):
+        colors = occupancy(labels)
+        current = occupancy(board_labels(board))
+        changed = np.flatnonzero(colors != current)
+        if len(changed) == 0:
+            return None
+
+        candidates = []
+        for move in board.legal_moves:
+            if move.from_square not in changed:
+                continue
+            board.push(move)
+            if np.array_equal(occupancy(board_labels(board)), colors):
+                candidates.append(move)
+            board.pop()
+
+        if not candidates:
+            return None
+
+        # All promotions look the same in the occupancy array,
+        # so use the recognized piece to pick one
+        for move in candidates:
+            if move.promotion is not None and piece_label(chess.Piece(move.promotion, board.turn)) == labels[move.to_square]:
+                return move
+        for move in candidates:
+            if move.promotion in (None, chess.QUEEN):
+                return move
+        return candidates[0]
+
+
+# Replays recorded frames (see ScreenGrabber.record_dir) and
+# reports the recognition speed and the moves it finds
+# Usage (from the src folder): python -m grabbers.board_recognizer <record_dir>
+def benchmark(record_dir):
+    with open(os.path.join(record_dir, "meta.json")) as f:
+        meta = json.load(f)
+    frames = sorted(glob.glob(os.path.join(record_dir, "frame_*.png")))
+
+    board = chess.Board()
+    for move in meta["moves"]:
+        board.push_san(move)
+
+    recognizer = BoardRecognizer(meta["is_white"])
+    recognizer.calibrate(Image.open(frames[0]), board)
+
+    frame_stats = LatencyStats("screen[frame->move]")
+    moves = []
+    for frame in frames[1:]:
+        image = Image.open(frame)
+        image.load()
+        start_time = time.perf_counter()
+        move = recognizer.find_move(board, recognizer.classify(image))
+        frame_stats.add(time.perf_counter() - start_time)
+        if move is not None:
+            moves.append(board.san(move))
+            board.push(move)
+
+    print(recognizer.classify_stats.summary())
+    print(frame_stats.summary())
+    print("target:", FRAME_TO_MOVE_TARGET * 1000, "ms", "met" if frame_stats.percentile(95) <= FRAME_TO_MOVE_TARGET * 1000 else "missed")
+    print("moves:", " ".join(moves))
+
+
+if __name__ == "__main__":
+    benchmark(sys.argv[1])
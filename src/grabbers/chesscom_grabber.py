@@ -1,4 +1,4 @@
-from selenium.common import NoSuchElementException
+from selenium.common import NoSuchElementException, StaleElementReferenceException
 from selenium.webdriver.common.by import By
 
 from grabbers.grabber import Grabber
@@ -10,13 +10,10 @@ class ChesscomGrabber(Grabber):
         self.moves_list = {}
 
     def update_board_elem(self):
-        try:
-            self._board_elem = self.chrome.find_element(By.XPATH, "//*[@id='board-play-computer']")
-        except NoSuchElementException:
-            try:
-                self._board_elem = self.chrome.find_element(By.XPATH, "//*[@id='board-single']")
-            except NoSuchElementException:
-                self._board_elem = None
+        self._board_elem = self.find_cached_element("board", [
+            (By.XPATH, "//*[@id='board-play-computer']"),
+            (By.XPATH, "//*[@id='board-single']"),
+        ], validate=True)
 
     def is_white(self):
         # Find the square names list
@@ -51,23 +48,22 @@ class ChesscomGrabber(Grabber):
         return num == "1"
 
     def is_game_over(self):
-        try:
-            # Find the game over window
-            game_over_window = self.chrome.find_element(By.CLASS_NAME, "board-modal-container")
-            return game_over_window is not None
-        except NoSuchElementException:
-            # Return False since the game over window is not found
-            return False
+        # The game over window only exists once the game is over, so it can't be cached
+        return len(self.chrome.find_elements(By.CLASS_NAME, "board-modal-container")) > 0
 
     def get_move_list(self):
-        # Find the moves list
+        # The cached elements are found again if the page was rebuilt
         try:
-            move_list_elem = self.chrome.find_element(By.CLASS_NAME, "play-controller-scrollable")
-        except NoSuchElementException:
-            try:
-                move_list_elem = self.chrome.find_element(By.CLASS_NAME, "move-list-wrapper-component")
-            except NoSuchElementException:
-                    return None
+            return self.read_move_list()
+        except StaleElementReferenceException:
+            self.clear_element_cache()
+            return self.read_move_list()
+
+    def read_move_list(self):
+        # Find the moves list
+        move_list_elem = self.get_move_list_container()
+        if move_list_elem is None:
+            return None
 
         # Select all children with class containing "white node" or "black node"
         # Moves that are not pawn moves have a different structure
@@ -113,6 +109,12 @@ class ChesscomGrabber(Grabber):
 
         return list(self.moves_list.values())
 
+    def get_move_list_container(self):
+        return self.find_cached_element("move_list_container", [
+            (By.CLASS_NAME, "play-controller-scrollable"),
+            (By.CLASS_NAME, "move-list-wrapper-component"),
+        ])
+
     def is_game_puzzles(self):
         return False
 
@@ -1,5 +1,7 @@
 from abc import ABC, abstractmethod
 
+from selenium.common import NoSuchElementException, StaleElementReferenceException
+
 from utilities import attach_to_session
 
 
@@ -9,9 +11,56 @@ class Grabber(ABC):
         self.chrome = attach_to_session(chrome_url, chrome_session_id)
         self._board_elem = None
 
+        # Elements found by find_cached_element, by name
+        self.element_cache = {}
+        self.element_cache_hits = 0
+        self.element_cache_misses = 0
+        self.element_cache_stale = 0
+
     def get_board(self):
         return self._board_elem
 
+    # Returns the element found with the first matching (by, value) locator,
+    # or None if none matches. The element is cached under name, so the next
+    # calls don't search the page again. A cached element that left the page
+    # raises StaleElementReferenceException when it is used: the callers catch
+    # it and call clear_element_cache. If validate is True, the cached element
+    # is checked first (one cheap command instead of a search)
+    # Ex. self.find_cached_element("moves", [(By.CLASS_NAME, "moves"), (By.CLASS_NAME, "move-list")])
+    def find_cached_element(self, name, locators, validate=False):
+        element = self.element_cache.get(name)
+        if element is not None and validate:
+            try:
+                element.is_enabled()
+            except StaleElementReferenceException:
+                self.clear_element_cache()
+                element = None
+
+        if element is not None:
+            self.element_cache_hits += 1
+            return element
+
+        self.element_cache_misses += 1
+        for by, value in locators:
+            try:
+                element = self.chrome.find_element(by, value)
+            except NoSuchElementException:
+                continue
+            self.element_cache[name] = element
+            return element
+        return None
+
+    # Forgets the cached elements. A stale element usually
+    # means that the page was rebuilt, so all of them are dropped
+    def clear_element_cache(self):
+        if self.element_cache:
+            self.element_cache_stale += 1
+        self.element_cache = {}
+
+    # Ex. "element cache: hits=120 misses=4 stale=0"
+    def get_element_cache_summary(self):
+        return f"element cache: hits={self.element_cache_hits} misses={self.element_cache_misses} stale={self.element_cache_stale}"
+
     # Returns the coordinates of the top left corner of the ChromeDriver
     def get_top_left_corner(self):
         canvas_x_offset = self.chrome.execute_script("return window.screenX + (window.outerWidth - window.innerWidth) / 2 - window.scrollX;")
@@ -53,6 +102,20 @@ class Grabber(ABC):
         pass
 
     # Makes a mouseless move
+    # Returns False if the site didn't take the move
     @abstractmethod
     def make_mouseless_move(self, move, move_count):
         pass
+
+    # Returns the element that contains the move list, or None if it is not found.
+    # It is only used for recording games (see replay.recorder)
+    def get_move_list_container(self):
+        return None
+
+    # Called after the bot made a move
+    def on_own_move(self, move_san):
+        pass
+
+    # Returns the LatencyStats collected by the grabber
+    def get_stats(self):
+        return []
@@ -1,9 +1,99 @@
+import logging
 import re
+import time
 
-from selenium.common import NoSuchElementException
+from selenium.common import NoSuchElementException, StaleElementReferenceException
 from selenium.webdriver.common.by import By
 
 from grabbers.grabber import Grabber
+from utilities import LatencyStats
+
+# timeout: milliseconds before an unacknowledged move is sent again
+# retries: how many times it is sent again before giving up
+MOVE_ACK = {
+    "timeout": 1000,
+    "retries": 2,
+}
+
+# Added to the ply to make the ack id of a move, so it doesn't
+# collide with the ids of the messages lichess sends itself
+ACK_ID_BASE = 1000000
+
+# Installed once per page: sends the moves on the lichess socket and
+# resolves when the server acknowledges them ("ack" message with the id
+# of the move) or broadcasts the move at that ply. The socket can be
+# replaced when lichess reconnects, so it is hooked again on every send
+MOVE_HELPER_SCRIPT = """
+const ackIdBase = arguments[0];
+const pending = {};
+let socket = null;
+
+function settle(id) {
+    const resolve = pending[id];
+    if (resolve) {
+        delete pending[id];
+        resolve();
+    }
+}
+
+function hook() {
+    const ws = lichess.socket.ws;
+    if (ws !== socket) {
+        socket = ws;
+        ws.addEventListener('message', event => {
+            let message;
+            try {
+                message = JSON.parse(event.data);
+            } catch (e) {
+                return;
+            }
+            if (!message) return;
+            if (message.t === 'ack') settle(message.d);
+            else if (message.t === 'move' && message.d) settle(ackIdBase + message.d.ply);
+        });
+    }
+    return ws;
+}
+
+// Resolves with {latency (ms), resends}, or null if it was never acknowledged
+window.__chessBotMoves = {
+    send(uci, ply, timeout, retries) {
+        const id = ackIdBase + ply;
+        const data = JSON.stringify({t: 'move', d: {u: uci, b: 1, a: id}});
+        const start = performance.now();
+        return new Promise(done => {
+            let attempts = 0;
+            let timer = null;
+            pending[id] = () => {
+                clearTimeout(timer);
+                done({latency: performance.now() - start, resends: attempts - 1});
+            };
+            const attempt = () => {
+                if (!(id in pending)) return;
+                if (attempts > retries) {
+                    delete pending[id];
+                    done(null);
+                    return;
+                }
+                attempts++;
+                hook().send(data);
+                timer = setTimeout(attempt, timeout);
+            };
+            attempt();
+        });
+    },
+};
+"""
+
+# The same text for every move, only the arguments change
+SUBMIT_MOVE_SCRIPT = """
+const done = arguments[arguments.length - 1];
+if (!window.__chessBotMoves) {
+    done('missing');
+} else {
+    window.__chessBotMoves.send(arguments[0], arguments[1], arguments[2], arguments[3]).then(done);
+}
+"""
 
 
 class LichessGrabber(Grabber):
@@ -11,18 +101,22 @@ class LichessGrabber(Grabber):
         super().__init__(chrome_url, chrome_session_id)
         self.tag_name = None
         self.moves_list = {}
+        self.puzzles = None
+
+        # Submit to ack time measured in the page, and the whole call
+        # (the difference is the WebDriver overhead)
+        self.move_ack_stats = LatencyStats("lichess-move[ack]")
+        self.move_submit_stats = LatencyStats("lichess-move[submit call]")
+        self.move_resends = 0
+        self.moves_lost = 0
 
     def update_board_elem(self):
-        try:
-            # Try finding the normal board
-            self._board_elem = self.chrome.find_element(By.XPATH,
-                                                        '//*[@id="main-wrap"]/main/div[1]/div[1]/div/cg-container')
-        except NoSuchElementException:
-            try:
-                # Try finding the board in the puzzles page
-                self._board_elem = self.chrome.find_element(By.XPATH, '/html/body/div[2]/main/div[1]/div/cg-container')
-            except NoSuchElementException:
-                self._board_elem = None
+        self._board_elem = self.find_cached_element("board", [
+            # The normal board
+            (By.XPATH, '//*[@id="main-wrap"]/main/div[1]/div[1]/div/cg-container'),
+            # The board in the puzzles page
+            (By.XPATH, '/html/body/div[2]/main/div[1]/div/cg-container'),
+        ], validate=True)
 
     def is_white(self):
         # sourcery skip: assign-if-exp, boolean-if-exp-identity, remove-unnecessary-cast
@@ -37,25 +131,17 @@ class LichessGrabber(Grabber):
     def is_game_over(self):
         # sourcery skip: assign-if-exp, boolean-if-exp-identity, reintroduce-else, remove-unnecessary-cast
         try:
-            # Find the game over window
-            self.chrome.find_element(By.XPATH, '//*[@id="main-wrap"]/main/aside/div/section[2]')
-
-            # If we don't have an exception at this point, we have found the game over window
-            return True
-        except NoSuchElementException:
-            # Try finding the puzzles game over window and checking its class
-            try:
-                # The game over window
-                game_over_window = self.chrome.find_element(By.XPATH, '/html/body/div[2]/main/div[2]/div[3]/div[1]')
-
-                if game_over_window.get_attribute("class") == "complete":
-                    return True
-
-                # If we don't have an exception at this point and the window's class is not "complete",
-                # then the game is still going
-                return False
-            except NoSuchElementException:
-                return False
+            if self.is_game_puzzles():
+                # The puzzles game over window, its class is "complete" when the puzzle is over
+                game_over_window = self.find_cached_element("puzzles_game_over", [(By.XPATH, '/html/body/div[2]/main/div[2]/div[3]/div[1]')])
+                return game_over_window is not None and game_over_window.get_attribute("class") == "complete"
+
+            # The game over window is added to the side panel when the game ends
+            side_panel = self.find_cached_element("side_panel", [(By.XPATH, '//*[@id="main-wrap"]/main/aside/div')])
+            return side_panel is not None and len(side_panel.find_elements(By.XPATH, './section[2]')) > 0
+        except StaleElementReferenceException:
+            self.clear_element_cache()
+            return False
 
     def set_moves_tag_name(self):
         if self.is_game_puzzles():
@@ -75,6 +161,14 @@ class LichessGrabber(Grabber):
             return False
 
     def get_move_list(self):
+        # The cached elements are found again if the page was rebuilt
+        try:
+            return self.read_move_list()
+        except StaleElementReferenceException:
+            self.clear_element_cache()
+            return self.read_move_list()
+
+    def read_move_list(self):
         # sourcery skip: assign-if-exp, merge-else-if-into-elif, use-fstring-for-concatenation
         is_puzzles = self.is_game_puzzles()
 
@@ -124,39 +218,51 @@ class LichessGrabber(Grabber):
         return [val for val in self.moves_list.values()]
 
     def get_puzzles_move_list_elem(self):
-        try:
-            # Try finding the move list in the puzzles page
-            move_list_elem = self.chrome.find_element(By.XPATH, '/html/body/div[2]/main/div[2]/div[2]/div')
+        # The move list in the puzzles page
+        return self.find_cached_element("move_list", [(By.XPATH, '/html/body/div[2]/main/div[2]/div[2]/div')])
 
+    def get_normal_move_list_elem(self):
+        move_list_elem = self.element_cache.get("move_list")
+        if move_list_elem is not None:
+            self.element_cache_hits += 1
             return move_list_elem
-        except NoSuchElementException:
+
+        # The move list (l4x) is only added to its container after the first move
+        container = self.get_move_list_container()
+        if container is None:
             return None
+        move_list_elems = container.find_elements(By.XPATH, "./l4x")
+        if not move_list_elems:
+            # We don't have any moves yet
+            return []
 
-    def get_normal_move_list_elem(self):
-        try:
-            # Try finding the normal move list
-            move_list_elem = self.chrome.find_element(By.XPATH, '//*[@id="main-wrap"]/main/div[1]/rm6/l4x')
+        self.element_cache["move_list"] = move_list_elems[0]
+        return move_list_elems[0]
 
-            return move_list_elem
-        except NoSuchElementException:
-            try:
-                # Try finding the normal move list when there are no moves yet
-                self.chrome.find_element(By.XPATH, '//*[@id="main-wrap"]/main/div[1]/rm6')
-
-                # If we don't have an exception at this point, we don't have any moves yet
-                return []
-            except NoSuchElementException:
-                return None
+    def get_move_list_container(self):
+        if self.is_game_puzzles():
+            return self.find_cached_element("move_list_container", [(By.XPATH, '/html/body/div[2]/main/div[2]/div[2]')])
+        return self.find_cached_element("move_list_container", [(By.XPATH, '//*[@id="main-wrap"]/main/div[1]/rm6')])
 
     def is_game_puzzles(self):
+        # The page type doesn't change during a game, so it is only checked
+        # again after the cached elements were dropped
+        if self.puzzles is not None:
+            return self.puzzles
+
         try:
             # Try finding the puzzles text
             self.chrome.find_element(By.XPATH, "/html/body/div[2]/main/aside/div[1]/div[1]/div/p[1]")
 
             # If we don't have an exception at this point, the game is a puzzle
-            return True
+            self.puzzles = True
         except NoSuchElementException:
-            return False
+            self.puzzles = False
+        return self.puzzles
+
+    def clear_element_cache(self):
+        super().clear_element_cache()
+        self.puzzles = None
 
     def click_puzzle_next(self):
         # Find the next continue training button
@@ -171,7 +277,27 @@ class LichessGrabber(Grabber):
         # Click the continue training button
         self.chrome.execute_script("arguments[0].click();", next_button)
 
+    # Sends the move on the lichess socket and waits for the server to acknowledge it
+    # Returns False if it wasn't acknowledged after the retries
     def make_mouseless_move(self, move, move_count):
-        message = '{"t":"move","d":{"u":"' + move + '","b":1,"a":' + str(move_count) + '}}'
-        script = 'lichess.socket.ws.send(JSON.stringify(' + message + '))'
-        self.chrome.execute_script(script)
+        start_time = time.perf_counter()
+        arguments = (move, move_count, MOVE_ACK["timeout"], MOVE_ACK["retries"])
+        result = self.chrome.execute_async_script(SUBMIT_MOVE_SCRIPT, *arguments)
+        if result == "missing":
+            # Not installed yet in this page
+            self.chrome.execute_script(MOVE_HELPER_SCRIPT, ACK_ID_BASE)
+            result = self.chrome.execute_async_script(SUBMIT_MOVE_SCRIPT, *arguments)
+        self.move_submit_stats.add(time.perf_counter() - start_time)
+
+        if result is None:
+            self.moves_lost += 1
+            logging.warning(f"Move {move} was not acknowledged after {MOVE_ACK['retries']} resends")
+            return False
+        self.move_ack_stats.add(result["latency"] / 1000)
+        self.move_resends += result["resends"]
+        return True
+
+    def get_stats(self):
+        if self.move_resends or self.moves_lost:
+            logging.info(f"lichess moves: {self.move_resends} resent, {self.moves_lost} not acknowledged")
+        return [self.move_ack_stats, self.move_submit_stats]
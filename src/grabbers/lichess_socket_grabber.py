@@ -0,0 +1,213 @@
+import json
+import sys
+import threading
+import time
+import urllib.request
+
+import websocket
+
+from grabbers.lichess_grabber import LichessGrabber
+from utilities import LatencyStats
+
+
+# Decodes a lichess socket message
+# Ex. {"t":"move","v":5,"d":{"uci":"e2e4","san":"e4","ply":1,"clock":{"white":180,"black":180}}}
+# Returns ("move", ply, san, clock), ("end",) or None for the other messages
+def decode_frame(payload):
+    if not payload.startswith("{"):
+        # Pings
+        return None
+    try:
+        message = json.loads(payload)
+    except ValueError:
+        return None
+
+    data = message.get("d")
+    if message.get("t") == "move" and isinstance(data, dict) and "ply" in data:
+        return "move", data["ply"], data["san"], data.get("clock")
+    if message.get("t") in ("end", "endData"):
+        return ("end",)
+    return None
+
+
+# Reads the lichess moves straight from the frames of the site
+# websocket, which arrive before the move list is re-rendered.
+# The frames are received through the DevTools endpoint of the
+# browser (Network.webSocketFrameReceived). The DOM grabber is
+# used for the starting position, for puzzles (they don't use
+# the socket) and whenever the DevTools connection fails
+class LichessSocketGrabber(LichessGrabber):
+    def __init__(self, chrome_url, chrome_session_id, debugger_address, compare_dom=False, record_path=None):
+        super().__init__(chrome_url, chrome_session_id)
+        self.debugger_address = debugger_address
+        self.devtools = None
+        self.lock = threading.Lock()
+
+        # Moves by ply and the time they were received
+        self.socket_moves = {}
+        self.socket_times = {}
+        self.game_ended = False
+        self.clock = None
+        self.base_move_list = None
+        self.is_puzzles = None
+        self.connect_attempted = False
+        self.returned_plies = 0
+
+        # If set, the DOM move list is read as well to measure how
+        # far behind the socket it is
+        self.compare_dom = compare_dom
+        self.dom_times = {}
+
+        # If set, the received frames and the DOM detection
+        # times are written to this file to be replayed
+        self.record_file = open(record_path, "a", buffering=1) if record_path is not None else None
+
+        self.frame_stats = LatencyStats("lichess-socket[frame->move]")
+        self.dom_lag_stats = LatencyStats("lichess-socket[dom lag]")
+
+    # Connects to the DevTools websocket of the lichess tab
+    # Returns True if the connection was made
+    def connect(self):
+        try:
+            with urllib.request.urlopen("http://" + self.debugger_address + "/json", timeout=1) as response:
+                targets = json.load(response)
+            target = [x for x in targets if x["type"] == "page" and "lichess.org" in x["url"]][0]
+
+            self.devtools = websocket.create_connection(target["webSocketDebuggerUrl"], suppress_origin=True)
+            self.devtools.send(json.dumps({"id": 1, "method": "Network.enable"}))
+        except (OSError, IndexError, KeyError, websocket.WebSocketException):
+            self.devtools = None
+            return False
+
+        devtools_thread = threading.Thread(target=self.devtools_thread, daemon=True)
+        devtools_thread.start()
+        return True
+
+    def devtools_thread(self):
+        while True:
+            try:
+                message = json.loads(self.devtools.recv())
+            except (OSError, ValueError, websocket.WebSocketException):
+                self.devtools = None
+                return
+
+            if message.get("method") == "Network.webSocketFrameReceived":
+                self.on_frame(message["params"]["response"]["payloadData"], time.perf_counter())
+
+    def on_frame(self, payload, received_time):
+        if self.record_file is not None:
+            self.record_file.write(json.dumps({"time": received_time, "payload": payload}) + "\n")
+
+        event = decode_frame(payload)
+        if event is None:
+            return
+
+        with self.lock:
+            if event[0] == "move":
+                ply, san, clock = event[1:]
+                if ply not in self.socket_moves:
+                    self.socket_moves[ply] = san
+                    self.socket_times[ply] = received_time
+                if clock is not None:
+                    self.clock = clock
+            else:
+                self.game_ended = True
+
+    def get_move_list(self):
+        # Read the moves that were made before connecting from the DOM once.
+        # The socket is connected first, so a move made while the DOM is
+        # read is received as a frame
+        if self.base_move_list is None:
+            self.is_puzzles = self.is_game_puzzles()
+            if not self.is_puzzles and not self.connect_attempted:
+                self.connect_attempted = True
+                self.connect()
+            self.base_move_list = super().get_move_list()
+            if self.base_move_list is None:
+                return None
+            self.returned_plies = len(self.base_move_list)
+            if self.is_puzzles or self.devtools is None:
+                return self.base_move_list
+
+        if self.is_puzzles or self.devtools is None:
+            return super().get_move_list()
+
+        if self.compare_dom:
+            self.measure_dom()
+
+        # A frame is missing (the following ones were received):
+        # take the moves up to the last one from the DOM
+        with self.lock:
+            missing = len(self.base_move_list) + 1 not in self.socket_moves and any(
+                ply > len(self.base_move_list) for ply in self.socket_moves
+            )
+        if missing:
+            dom_move_list = super().get_move_list()
+            if dom_move_list is not None and len(dom_move_list) > len(self.base_move_list):
+                self.base_move_list = dom_move_list
+
+        # Add the socket moves that follow the base move list
+        move_list = list(self.base_move_list)
+        with self.lock:
+            while len(move_list) + 1 in self.socket_moves:
+                move_list.append(self.socket_moves[len(move_list) + 1])
+
+            now = time.perf_counter()
+            for ply in range(self.returned_plies + 1, len(move_list) + 1):
+                if ply in self.socket_times:
+                    self.frame_stats.add(now - self.socket_times[ply])
+            self.returned_plies = len(move_list)
+
+        return move_list
+
+    # Records how long after the socket frame each move shows up in the DOM
+    def measure_dom(self):
+        dom_move_list = super().get_move_list()
+        if dom_move_list is None:
+            return
+
+        now = time.perf_counter()
+        with self.lock:
+            for ply in range(len(self.base_move_list) + 1, len(dom_move_list) + 1):
+                if ply not in self.dom_times:
+                    self.dom_times[ply] = now
+                    if self.record_file is not None:
+                        self.record_file.write(json.dumps({"time": now, "dom_ply": ply}) + "\n")
+                    self.dom_lag_stats.add(max(0.0, now - self.socket_times.get(ply, now)))
+
+    def is_game_over(self):
+        if self.devtools is None or self.is_puzzles:
+            return super().is_game_over()
+        with self.lock:
+            return self.game_ended
+
+    def get_stats(self):
+        return super().get_stats() + [self.frame_stats, self.dom_lag_stats]
+
+
+# Replays a recorded frame file, decoding the frames again and comparing
+# when each move was available from the socket and from the DOM
+# Usage (from the src folder): python -m grabbers.lichess_socket_grabber <record_path>
+def replay(record_path):
+    decode_stats = LatencyStats("lichess-socket[decode]")
+    dom_lag_stats = LatencyStats("lichess-socket[dom lag]")
+    socket_times = {}
+
+    with open(record_path) as f:
+        for line in f:
+            record = json.loads(line)
+            if "payload" in record:
+                start_time = time.perf_counter()
+                event = decode_frame(record["payload"])
+                decode_stats.add(time.perf_counter() - start_time)
+                if event is not None and event[0] == "move":
+                    socket_times.setdefault(event[1], record["time"])
+            elif record["dom_ply"] in socket_times:
+                dom_lag_stats.add(max(0.0, record["time"] - socket_times[record["dom_ply"]]))
+
+    print(decode_stats.summary())
+    print(dom_lag_stats.summary())
+
+
+if __name__ == "__main__":
+    replay(sys.argv[1])
@@ -0,0 +1,121 @@
+import base64
+import io
+import json
+import os
+import time
+
+import chess
+from PIL import Image
+
+from grabbers.board_recognizer import BoardRecognizer
+from grabbers.grabber import Grabber
+from utilities import execute_cdp_cmd, LatencyStats
+
+
+# Reads the moves from captures of the board instead of the move list.
+# The site grabber is still used to find the board once, for the player
+# color, the game over checks and the mouseless moves
+class ScreenGrabber(Grabber):
+    def __init__(self, site_grabber, record_dir=None):
+        # The site grabber is already attached to the browser
+        self.site_grabber = site_grabber
+        self.chrome = site_grabber.chrome
+        self._board_elem = None
+
+        self.recognizer = None
+        self.board = None
+        self.board_rect = None
+        self.frame_stats = LatencyStats("screen[frame->move]")
+
+        # If set, the frames are saved for grabbers.board_recognizer.benchmark
+        self.record_dir = record_dir
+        self.frames_num = 0
+
+    def update_board_elem(self):
+        self.site_grabber.update_board_elem()
+        self._board_elem = self.site_grabber.get_board()
+
+        if self._board_elem is not None:
+            rect = self.chrome.execute_script(
+                "const r = arguments[0].getBoundingClientRect();"
+                "return [r.left + window.scrollX, r.top + window.scrollY, r.width, r.height];",
+                self._board_elem
+            )
+            self.board_rect = {"x": rect[0], "y": rect[1], "width": rect[2], "height": rect[3], "scale": 1}
+
+    def is_white(self):
+        return self.site_grabber.is_white()
+
+    def is_game_over(self):
+        return self.site_grabber.is_game_over()
+
+    # Returns an image of the board
+    def capture(self):
+        screenshot = execute_cdp_cmd(self.chrome, "Page.captureScreenshot", {"format": "png", "clip": self.board_rect})
+        data = base64.b64decode(screenshot["data"])
+
+        if self.record_dir is not None:
+            with open(os.path.join(self.record_dir, "frame_%05d.png" % self.frames_num), "wb") as f:
+                f.write(data)
+            self.frames_num += 1
+
+        return Image.open(io.BytesIO(data))
+
+    def get_move_list(self):
+        # Read the starting position from the move list once
+        # and use it to learn how the pieces look
+        if self.recognizer is None:
+            move_list = self.site_grabber.get_move_list()
+            if move_list is None:
+                return None
+
+            self.board = chess.Board()
+            for move in move_list:
+                self.board.push_san(move)
+
+            if self.record_dir is not None:
+                os.makedirs(self.record_dir, exist_ok=True)
+                with open(os.path.join(self.record_dir, "meta.json"), "w") as f:
+                    json.dump({"is_white": self.is_white(), "moves": move_list}, f)
+
+            self.recognizer = BoardRecognizer(self.is_white())
+            self.recognizer.calibrate(self.capture(), self.board)
+            self.move_list = move_list
+            return list(self.move_list)
+
+        start_time = time.perf_counter()
+        move = BoardRecognizer.find_move(self.board, self.recognizer.classify(self.capture()))
+        if move is not None:
+            self.move_list.append(self.board.san(move))
+            self.board.push(move)
+            self.frame_stats.add(time.perf_counter() - start_time)
+
+        return list(self.move_list)
+
+    # Tracks the bot moves right away, so that a fast reply
+    # doesn't show up as two moves in the next frame
+    def on_own_move(self, move_san):
+        if self.board is not None:
+            self.move_list.append(move_san)
+            self.board.push_san(move_san)
+
+    def is_game_puzzles(self):
+        return self.site_grabber.is_game_puzzles()
+
+    def click_puzzle_next(self):
+        self.site_grabber.click_puzzle_next()
+
+    def make_mouseless_move(self, move, move_count):
+        return self.site_grabber.make_mouseless_move(move, move_count)
+
+    def get_move_list_container(self):
+        return self.site_grabber.get_move_list_container()
+
+    def get_element_cache_summary(self):
+        return self.site_grabber.get_element_cache_summary()
+
+    def get_stats(self):
+        stats = [self.frame_stats]
+        if self.recognizer is not None:
+            stats.append(self.recognizer.classify_stats)
+        return stats
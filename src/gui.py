@@ -1,6 +1,8 @@
 import multiprocessing 
+import os
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
 from selenium import webdriver
@@ -9,43 +11,29 @@ from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options
 from selenium.common.exceptions import WebDriverException
 from overlay import run
-from stockfish_bot import StockfishBot
+from stockfish_bot import run_bot
+from engines.engine_host import EngineClient, EngineHost, engine_parameters
+from engines.auto_tune import auto_tune, load_tuned_parameters, save_tuned_parameters
+from shared_state import SharedState, moves_to_san, NO_MATE
+from profiler import SamplingProfiler, is_profiling_enabled_by_env, profile_tag
+from log_pipeline import ContextFilter, setup_logging
+from resource_monitor import RECYCLE, ResourceMonitor, is_tracemalloc_enabled_by_env, start_tracemalloc_snapshots
+from browser_profile import create_chrome_options, get_debugger_address, load_browser_session, reattach_browser, save_browser_session
+from worker_pool import WorkerPool
+from placement import apply_plan, format_cores, get_available_cores, is_placement_supported, plan_placement
+import chess
 import keyboard
 import logging
-from logging.handlers import RotatingFileHandler
-import sys
 from webdriver_manager.core.utils import get_browser_version_from_os
 
-#Logging config
-def setup_logging():
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
-    
-    handler = RotatingFileHandler(
-        'chess_bot.log', 
-        maxBytes=1024*1024,  # 1MB
-        backupCount=3,
-        encoding='utf-8'
-    )
-    formatter = logging.Formatter(
-        '%(asctime)s - %(levelname)s - %(message)s',
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
-    
-    # Log também para stdout
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-
-setup_logging()
-
-
 class GUI:
-    def __init__(self, master):
+    def __init__(self, master, log_queue, log_context):
         self.master = master
 
+        # Every process sends its log records through this queue
+        self.log_queue = log_queue
+        self.log_context = log_context
+
         # Used for closing the threads
         self.exit = False
 
@@ -56,6 +44,8 @@ class GUI:
         # self.stockfish_bot = None
         self.chrome_url = None
         self.chrome_session_id = None
+        self.chrome_debugger_address = None
+        self.chromedriver_path = None
 
         # Used for the communication between the GUI
         # and the Stockfish Bot process
@@ -65,10 +55,26 @@ class GUI:
         # The Stockfish Bot process
         self.stockfish_bot_process = None
         self.overlay_screen_process = None
+
+        # The bot and overlay processes of the next game, started ahead
+        # of time. start_time is when Start was pressed
+        self.worker_pool = WorkerPool(run_bot, run, ("inputs.pyautogui_input_backend",))
+        self.start_time = None
         self.restart_after_stopping = False
 
-        # Used for storing the match moves
-        self.match_moves = []
+        # The pre-warmed Stockfish process and the pipe
+        # that is handed to the Stockfish Bot on start
+        self.engine_host_process = None
+        self.engine_pipe = None
+
+        # Used for tagging the profiles and the logs of the GUI, bot and overlay processes
+        self.session_id = log_context.session_id
+        self.game_id = 0
+        self.gui_profiler = None
+
+        # The game state shared with the Stockfish Bot and the overlay
+        # (the moves, the arrows and the evaluation)
+        self.state = SharedState(["gui", "overlay"])
 
         # Set the window properties
         master.title("Chess")
@@ -153,6 +159,41 @@ class GUI:
         )
         self.mouseless_mode_checkbox.pack(anchor=tk.NW)
 
+        # Create the input backend radio buttons
+        self.input_backend = tk.StringVar(value="pyautogui")
+        self.pyautogui_radio_button = tk.Radiobutton(
+            left_frame,
+            text="Mouse input",
+            variable=self.input_backend,
+            value="pyautogui"
+        )
+        self.pyautogui_radio_button.pack(anchor=tk.NW)
+        self.cdp_radio_button = tk.Radiobutton(
+            left_frame,
+            text="DevTools input",
+            variable=self.input_backend,
+            value="cdp"
+        )
+        self.cdp_radio_button.pack(anchor=tk.NW)
+
+        # Create the screen recognition check button
+        self.enable_screen_grabber = tk.IntVar(value=0)
+        self.screen_grabber_check_button = tk.Checkbutton(
+            left_frame,
+            text="Screen recognition",
+            variable=self.enable_screen_grabber
+        )
+        self.screen_grabber_check_button.pack(anchor=tk.NW)
+
+        # Create the lichess socket check button
+        self.enable_socket_grabber = tk.IntVar(value=0)
+        self.socket_grabber_check_button = tk.Checkbutton(
+            left_frame,
+            text="Lichess socket moves",
+            variable=self.enable_socket_grabber
+        )
+        self.socket_grabber_check_button.pack(anchor=tk.NW)
+
         # Create the non-stop puzzles check button
         self.enable_non_stop_puzzles = tk.IntVar(value=0)
         self.non_stop_puzzles_check_button = tk.Checkbutton(
@@ -162,6 +203,33 @@ class GUI:
         )
         self.non_stop_puzzles_check_button.pack(anchor=tk.NW)
 
+        # Create the early stop check button
+        self.enable_early_stop = tk.IntVar(value=0)
+        self.early_stop_check_button = tk.Checkbutton(
+            left_frame,
+            text="Stop search early",
+            variable=self.enable_early_stop
+        )
+        self.early_stop_check_button.pack(anchor=tk.NW)
+
+        # Create the fast path check button
+        self.enable_fast_path = tk.IntVar(value=1)
+        self.fast_path_check_button = tk.Checkbutton(
+            left_frame,
+            text="Instant forced moves",
+            variable=self.enable_fast_path
+        )
+        self.fast_path_check_button.pack(anchor=tk.NW)
+
+        # Create the record game check button
+        self.enable_recording = tk.IntVar()
+        self.recording_check_button = tk.Checkbutton(
+            left_frame,
+            text="Record game",
+            variable=self.enable_recording
+        )
+        self.recording_check_button.pack(anchor=tk.NW)
+
         # Create the bongcloud check button
         self.enable_bongcloud = tk.IntVar()
         self.bongcloud_check_button = tk.Checkbutton(
@@ -239,6 +307,25 @@ class GUI:
         self.cpu_threads_entry.pack()
         cpu_threads_frame.pack(anchor=tk.NW)
 
+        # Create the speculation threads entry field (0 turns the speculation off)
+        speculation_threads_frame = tk.Frame(left_frame)
+        tk.Label(speculation_threads_frame, text="Speculation Threads").pack(side=tk.LEFT)
+        self.speculation_threads = tk.IntVar(value=0)
+        self.speculation_threads_entry = tk.Entry(
+            speculation_threads_frame, textvariable=self.speculation_threads, justify="center", width=4
+        )
+        self.speculation_threads_entry.pack()
+        speculation_threads_frame.pack(anchor=tk.NW)
+
+        # Create the auto-tune button
+        self.tuning = False
+        self.auto_tune_button = tk.Button(
+            left_frame,
+            text="Auto-tune Threads/Memory",
+            command=self.on_auto_tune_button_listener,
+        )
+        self.auto_tune_button.pack(anchor=tk.NW, pady=(5, 0))
+
         # Separator
         separator_frame = tk.Frame(left_frame)
         separator = ttk.Separator(separator_frame, orient="horizontal")
@@ -259,6 +346,46 @@ class GUI:
         )
         self.topmost_check_button.pack(anchor=tk.NW)
 
+        # Create the profiling check button
+        self.enable_profiling = tk.IntVar(value=1 if is_profiling_enabled_by_env() else 0)
+        self.profiling_check_button = tk.Checkbutton(
+            left_frame,
+            text="Profiling",
+            variable=self.enable_profiling
+        )
+        self.profiling_check_button.pack(anchor=tk.NW)
+
+        # Create the browser profile check buttons
+        self.enable_browser_profile = tk.IntVar(value=1)
+        self.browser_profile_check_button = tk.Checkbutton(
+            left_frame,
+            text="Persistent browser profile",
+            variable=self.enable_browser_profile
+        )
+        self.browser_profile_check_button.pack(anchor=tk.NW)
+        self.enable_lean_browser = tk.IntVar()
+        self.lean_browser_check_button = tk.Checkbutton(
+            left_frame,
+            text="Disable unneeded browser features",
+            variable=self.enable_lean_browser
+        )
+        self.lean_browser_check_button.pack(anchor=tk.NW)
+
+        # Create the process placement check button and the applied placement text
+        self.available_cores = get_available_cores() if is_placement_supported() else None
+        self.placement_applied = False
+        self.enable_placement = tk.IntVar()
+        self.placement_check_button = tk.Checkbutton(
+            left_frame,
+            text="Pin processes to cores",
+            variable=self.enable_placement
+        )
+        if self.available_cores is None:
+            self.placement_check_button["state"] = "disabled"
+        self.placement_check_button.pack(anchor=tk.NW)
+        self.placement_text = tk.Label(left_frame, text="", wraplength=180)
+        self.placement_text.pack(anchor=tk.NW)
+
         # Create the select stockfish button
         self.stockfish_path = ""
         self.select_stockfish_button = tk.Button(
@@ -309,6 +436,14 @@ class GUI:
 
         treeview_frame.pack(anchor=tk.NW)
 
+        # Create the search info text
+        self.search_info_text = tk.Label(right_frame, text="", anchor=tk.W, width=25)
+        self.search_info_text.pack(anchor=tk.NW)
+
+        # Resources text (memory and CPU usage of the processes)
+        self.resources_text = tk.Label(right_frame, text="", anchor=tk.W, justify=tk.LEFT, width=25)
+        self.resources_text.pack(anchor=tk.NW)
+
         # Create the export PGN button
         self.export_pgn_button = tk.Button(
             right_frame, text="Export PGN", command=self.on_export_pgn_button_listener
@@ -331,16 +466,36 @@ class GUI:
         )
         process_communicator_thread.start()
 
+        # Start the shared state reader thread
+        shared_state_reader_thread = threading.Thread(
+            target=self.shared_state_reader_thread
+        )
+        shared_state_reader_thread.start()
+
         # Start the keyboard listener thread
         keyboard_listener_thread = threading.Thread(
             target=self.keypress_listener_thread
         )
         keyboard_listener_thread.start()
 
+        # Start the resource monitor
+        self.recycle_pending = False
+        self.resource_monitor = ResourceMonitor(
+            self.session_id, self.get_pids_by_role, self.show_resources, self.on_resource_threshold
+        )
+        self.resource_monitor.start()
+        if is_tracemalloc_enabled_by_env():
+            start_tracemalloc_snapshots(self.session_id, "gui")
+
+        self.try_reattach_browser()
+
     # Detects if the user pressed the close button
     def on_close_listener(self):
         # Set self.exit to True so that the threads will stop
         self.exit = True
+        self.resource_monitor.stop()
+        self.stop_engine_host()
+        self.state.unlink()
         self.master.destroy()
 
     # Detects if the Stockfish Bot process is running
@@ -359,6 +514,45 @@ class GUI:
                     self.on_start_button_listener()
             time.sleep(0.1)
 
+    # Shows the moves written to the shared state by the Stockfish Bot process
+    def shared_state_reader_thread(self):
+        game_id = None
+        board = chess.Board()
+        while not self.exit:
+            if not self.state.wait("gui", 0.1):
+                continue
+
+            self.show_search_info()
+
+            # A new game overwrites the Treeview
+            if self.state.get_game_id() != game_id:
+                game_id, moves = self.state.get_moves()
+                board = chess.Board()
+                self.set_moves(moves_to_san(moves))
+                for move in moves:
+                    board.push(move)
+            else:
+                game_id, moves = self.state.get_moves(len(board.move_stack))
+                for move in moves:
+                    self.insert_move(board.san(move))
+                    board.push(move)
+            self.tree.yview_moveto(1)
+
+    # Shows the depth, the evaluation and the start of the principal variation
+    # Ex. "D18 +0.35 e2e4 e7e5 g1f3"
+    def show_search_info(self):
+        depth, cp, mate, pv = self.state.get_search_info()
+        if depth == 0:
+            text = ""
+        elif mate != NO_MATE:
+            text = f"D{depth} #{mate} " + " ".join(move.uci() for move in pv[:3])
+        else:
+            text = f"D{depth} {cp / 100:+.2f} " + " ".join(move.uci() for move in pv[:3])
+
+        if self.search_info_text["text"] != text:
+            self.search_info_text["text"] = text
+            self.search_info_text.update()
+
     # Detects if Selenium Chromedriver is running
     def browser_checker_thread(self):
         while not self.exit:
@@ -383,12 +577,9 @@ class GUI:
             time.sleep(0.1)
 
     # Responsible for communicating with the Stockfish Bot process
+    # (the moves are read from the shared state instead)
     # The pipe can receive the following commands:
     # - "START": Resets and starts the Stockfish Bot
-    # - "S_MOVE": Sends the Stockfish Bot a single move to make
-    #   Ex. "S_MOVEe4
-    # - "M_MOVE": Sends the Stockfish Bot multiple moves to make
-    #   Ex. "S_MOVEe4,c5,Nf3
     # - "ERR_EXE": Notifies the GUI that the Stockfish Bot can't initialize Stockfish
     # - "ERR_PERM": Notifies the GUI that the Stockfish Bot can't execute the Stockfish executable
     # - "ERR_BOARD": Notifies the GUI that the Stockfish Bot can't find the board
@@ -404,11 +595,14 @@ class GUI:
                 ):
                     data = self.stockfish_bot_pipe.recv()
                     if data == "START":
-                        self.clear_tree()
-                        self.match_moves = []
+                        start_latency = time.perf_counter() - self.start_time
+                        logging.info(f"Bot started in {start_latency * 1000:.0f}ms")
+
+                        # Park the workers of the next game now that this one runs
+                        self.worker_pool.park(self.state, self.engine_pipe, self.log_queue)
 
                         # Update the status text
-                        self.status_text["text"] = "Running"
+                        self.status_text["text"] = f"Running (started in {start_latency * 1000:.0f} ms)"
                         self.status_text["fg"] = "green"
                         self.status_text.update()
 
@@ -420,16 +614,6 @@ class GUI:
                     elif data[:7] == "RESTART":
                         self.restart_after_stopping = True
                         self.stockfish_bot_pipe.send("DELETE")
-                    elif data[:6] == "S_MOVE":
-                        move = data[6:]
-                        self.match_moves.append(move)
-                        self.insert_move(move)
-                        self.tree.yview_moveto(1)
-                    elif data[:6] == "M_MOVE":
-                        moves = data[6:].split(",")
-                        self.match_moves += moves
-                        self.set_moves(moves)
-                        self.tree.yview_moveto(1)
                     elif data[:7] == "ERR_EXE":
                         tk.messagebox.showerror(
                             "Error",
@@ -483,90 +667,151 @@ class GUI:
         self.open_browser_button["state"] = "disabled"
         self.open_browser_button.update()
 
-        try:
-        logging.info("Attempting to open Chrome browser")
-        
-        # check chrome version before open
-        try:
-            chrome_version = get_browser_version_from_os("chrome")
-            logging.info(f"Detected Chrome version: {chrome_version}")
-        except Exception as e:
-            logging.warning(f"Could not detect Chrome version: {str(e)}")
+        # The options are read here, the launch runs in the background
+        # so the GUI keeps responding while Chrome starts
+        open_browser_thread = threading.Thread(
+            target=self.open_browser_thread,
+            args=(self.enable_browser_profile.get() == 1, self.enable_lean_browser.get() == 1, self.website.get()),
+            daemon=True,
+        )
+        open_browser_thread.start()
 
+    # Shows the current stage of the launch on the Open Browser button
+    def show_browser_stage(self, text):
+        self.open_browser_button["text"] = text
+        self.open_browser_button.update()
 
-        # Open Webdriver
-        options = webdriver.ChromeOptions()
-        options.add_experimental_option("excludeSwitches", ["enable-logging"]) 
+    # Runs one stage of the launch and logs how long it took
+    def run_browser_stage(self, name, function, *args, **kwargs):
+        start_time = time.perf_counter()
         try:
-           service = ChromeService(ChromeDriverManager().install())
-            logging.info("ChromeDriver installed successfully")
-            
-            self.chrome = webdriver.Chrome(
-                service=service,
-                options=options
-            )
-            logging.info("Chrome WebDriver initialized successfully")
-        except WebDriverException as e:
-            error_msg = "Failed to initialize WebDriver"
-            logging.error(f"{error_msg}: {str(e)}", exc_info=True)
-            
-            self._handle_browser_error(
-                "Chrome Not Found",
-                "Google Chrome is required but not found.\n\n"
-                "Please install Chrome from:\n"
-                "https://www.google.com/chrome/\n\n"
-                "Error details:\n"
-                f"{str(e)}"
-            )
-            return
-            except PermissionError as e:
-            error_msg = "Permission denied when accessing ChromeDriver"
-            logging.error(f"{error_msg}: {str(e)}", exc_info=True)
-            
-            self._handle_browser_error(
-                "Permission Error",
-                "Could not access ChromeDriver due to permission issues.\n\n"
-                "Please try:\n"
-                "1. Running as administrator\n"
-                "2. Checking file permissions\n\n"
-                "Error details:\n"
-                f"{str(e)}"
-            )
-            return
-            except Exception as e:
-            error_msg = "Unexpected error initializing Chrome"
-            logging.error(f"{error_msg}: {str(e)}", exc_info=True)
-            
-            self._handle_browser_error(
-                "Unexpected Error",
-                "An unexpected error occurred while starting Chrome.\n\n"
-                "Please check the log file for details.\n"
-                "Error details:\n"
-                f"{str(e)}"
-            )
-            return
+            return function(*args, **kwargs)
+        finally:
+            logging.info(f"Browser stage {name}: {(time.perf_counter() - start_time) * 1000:.0f} ms")
 
-        # Open chess.com
-        if self.website.get() == "chesscom":
-            self.chrome.get("https://www.chess.com")
+    # Spawns the engine and parks the bot workers if it wasn't done yet,
+    # so they are ready when Start is pressed after the browser opens
+    def prespawn_engine(self):
+        if self.stockfish_path == "":
+            return
+        if self.engine_host_process is None or not self.engine_host_process.is_alive():
+            self.start_engine_host()
         else:
-            self.chrome.get("https://www.lichess.org")
+            self.worker_pool.park(self.state, self.engine_pipe, self.log_queue)
+
+    # Opens Chrome in stages. The Chrome version check, the chromedriver
+    # install and the engine spawn don't depend on each other and run at
+    # the same time, the engine keeps starting during the launch and the
+    # navigation
+    def open_browser_thread(self, use_profile, lean, website):
+        start_time = time.perf_counter()
+        logging.info("Attempting to open Chrome browser")
+        try:
+            with ThreadPoolExecutor(max_workers=3) as executor:
+                self.show_browser_stage("Resolving driver...")
+                chrome_version = executor.submit(self.run_browser_stage, "chrome version", get_browser_version_from_os, "chrome")
+                chromedriver_path = executor.submit(self.run_browser_stage, "driver", lambda: ChromeDriverManager().install())
+                engine = executor.submit(self.run_browser_stage, "engine pre-spawn", self.prespawn_engine)
+
+                # check chrome version before open
+                try:
+                    logging.info(f"Detected Chrome version: {chrome_version.result()}")
+                except Exception as e:
+                    logging.warning(f"Could not detect Chrome version: {str(e)}")
+
+                # Open Webdriver
+                options = create_chrome_options(use_profile, lean)
+                try:
+                    self.chromedriver_path = chromedriver_path.result()
+                    service = ChromeService(self.chromedriver_path)
+                    logging.info("ChromeDriver installed successfully")
+
+                    self.show_browser_stage("Launching Chrome...")
+                    self.chrome = self.run_browser_stage("launch", webdriver.Chrome, service=service, options=options)
+                    logging.info("Chrome WebDriver initialized successfully")
+                except WebDriverException as e:
+                    error_msg = "Failed to initialize WebDriver"
+                    logging.error(f"{error_msg}: {str(e)}", exc_info=True)
+
+                    self.show_browser_error(
+                        "Chrome Not Found",
+                        "Google Chrome is required but not found.\n\n"
+                        "Please install Chrome from:\n"
+                        "https://www.google.com/chrome/\n\n"
+                        "Error details:\n"
+                        f"{str(e)}"
+                    )
+                    return
+                except PermissionError as e:
+                    error_msg = "Permission denied when accessing ChromeDriver"
+                    logging.error(f"{error_msg}: {str(e)}", exc_info=True)
+
+                    self.show_browser_error(
+                        "Permission Error",
+                        "Could not access ChromeDriver due to permission issues.\n\n"
+                        "Please try:\n"
+                        "1. Running as administrator\n"
+                        "2. Checking file permissions\n\n"
+                        "Error details:\n"
+                        f"{str(e)}"
+                    )
+                    return
+                except Exception as e:
+                    error_msg = "Unexpected error initializing Chrome"
+                    logging.error(f"{error_msg}: {str(e)}", exc_info=True)
+
+                    self.show_browser_error(
+                        "Unexpected Error",
+                        "An unexpected error occurred while starting Chrome.\n\n"
+                        "Please check the log file for details.\n"
+                        "Error details:\n"
+                        f"{str(e)}"
+                    )
+                    return
+
+                # Open chess.com
+                self.show_browser_stage("Loading site...")
+                url = "https://www.chess.com" if website == "chesscom" else "https://www.lichess.org"
+                self.run_browser_stage("navigation", self.chrome.get, url)
+
+                # A failed engine spawn doesn't stop the browser from opening,
+                # selecting the Stockfish path again starts a new one
+                try:
+                    engine.result()
+                except Exception:
+                    logging.exception("Failed to pre-spawn the engine")
+
+            self.on_browser_opened(self.chrome.service.service_url, get_debugger_address(self.chrome))
+            logging.info(f"Browser successfully opened and configured in {time.perf_counter() - start_time:.2f}s")
 
-        # Store connection details
-        self.chrome_url = self.chrome.service.service_url
-        self.chrome_session_id = self.chrome.session_id
-        logging.info("Browser successfully opened and configured")
+        except Exception as e:
+            logging.error(f"Unexpected error in browser opening: {str(e)}", exc_info=True)
+            self.show_browser_error(
+                "Critical Error",
+                "A critical error occurred. Please check the log file.\n"
+                f"Error: {str(e)}"
+            )
 
-        # Update UI
-        self.opening_browser = False
-        self.opened_browser = True
-        self.open_browser_button["text"] = "Browser is open"
-        self.open_browser_button["state"] = "disabled"
-        self.open_browser_button.update()
+    # The error dialog is shown from the Tk main thread
+    def show_browser_error(self, title, message):
+        self.master.after(0, self._handle_browser_error, title, message)
 
-        # Build Stockfish Bot
-        self.chrome_url = self.chrome.service.service_url
+    # Stores the connection details of the browser, saves them for the
+    # next GUI run (see try_reattach_browser) and enables the Start button
+    def on_browser_opened(self, chrome_url, debugger_address):
+        self.chrome_url = chrome_url
         self.chrome_session_id = self.chrome.session_id
+        self.chrome_debugger_address = debugger_address
+        try:
+            save_browser_session(
+                self.chrome_url,
+                self.chrome_session_id,
+                self.chrome_debugger_address,
+                self.chromedriver_path,
+                self.website.get(),
+            )
+        except OSError:
+            logging.exception("Failed to save the browser session")
 
         # Set Opening Browser button state to opened
         self.opening_browser = False
@@ -579,25 +824,57 @@ class GUI:
         self.start_button["state"] = "normal"
         self.start_button.update()
 
-    except Exception as e:
-        logging.error(f"Unexpected error in browser opening: {str(e)}", exc_info=True)
-        self._handle_browser_error(
-            "Critical Error",
-            "A critical error occurred. Please check the log file.\n"
-            f"Error: {str(e)}"
-        )
+    # Reattaches to the browser left open by the previous GUI run instead
+    # of opening a new one, which skips the driver install and the Chrome launch
+    def try_reattach_browser(self):
+        session = load_browser_session()
+        if session is None:
+            return
+
+        start_time = time.perf_counter()
+        try:
+            result = reattach_browser(session)
+        except Exception:
+            logging.exception("Failed to reattach to the browser")
+            return
+        if result is None:
+            logging.info("The browser of the previous session is closed")
+            return
+
+        self.chrome, chrome_url = result
+        self.chromedriver_path = session.get("chromedriver_path")
+        if session.get("website") in ("chesscom", "lichess"):
+            self.website.set(session["website"])
+        self.on_browser_opened(chrome_url, session.get("debugger_address"))
+        logging.info(f"Reattached to the browser in {time.perf_counter() - start_time:.2f}s")
+
+    # Returns the pid of chromedriver, or None if it isn't ours (a browser
+    # reattached through the chromedriver of a previous GUI run)
+    def get_chromedriver_pid(self):
+        service = getattr(self.chrome, "service", None)
+        if service is None or service.process is None:
+            return None
+        return service.process.pid
 
     def _handle_browser_error(self, title, message):
-    """Centralized browser error handling"""
-    self.opening_browser = False
-    self.open_browser_button["text"] = "Open Browser"
-    self.open_browser_button["state"] = "normal"
-    self.open_browser_button.update()
+        """Centralized browser error handling"""
+        self.opening_browser = False
+        self.open_browser_button["text"] = "Open Browser"
+        self.open_browser_button["state"] = "normal"
+        self.open_browser_button.update()
     
-    logging.error(f"Browser error: {title} - {message}")
-    tk.messagebox.showerror(title, message)
+        logging.error(f"Browser error: {title} - {message}")
+        tk.messagebox.showerror(title, message)
 
     def on_start_button_listener(self):
+        # The engine is busy with the auto-tune searches
+        if self.tuning:
+            return
+
+        # Free the memory that grew during the previous games
+        if self.recycle_pending:
+            self.recycle()
+
         # Check if Slow mover value is valid
         slow_mover = self.slow_mover.get()
         if slow_mover < 10 or slow_mover > 1000:
@@ -615,47 +892,54 @@ class GUI:
             )
             return
 
-        # Check if mouseless mode is enabled when on chess.com
-        if self.enable_mouseless_mode.get() == 1 and self.website.get() == "chesscom":
-            tk.messagebox.showerror(
-                "Error", "Mouseless mode is only supported on lichess.org"
-            )
-            return
-
-        # Create the pipes used for the communication
-        # between the GUI and the Stockfish Bot process
-        parent_conn, child_conn = multiprocessing.Pipe()
-        self.stockfish_bot_pipe = parent_conn
-
-        # Create the message queue that is used for the communication
-        # between the Stockfish and the Overlay processes
-        st_ov_queue = multiprocessing.Queue()
-
-        # Create the Stockfish Bot process
-        self.stockfish_bot_process = StockfishBot(
-            self.chrome_url,
-            self.chrome_session_id,
-            self.website.get(),
-            child_conn,
-            st_ov_queue,
-            self.stockfish_path,
-            self.enable_manual_mode.get() == 1,
-            self.enable_mouseless_mode.get() == 1,
-            self.enable_non_stop_puzzles.get() == 1,
-            self.enable_bongcloud.get() == 1,
-            self.slow_mover.get(),
-            self.skill_level.get(),
-            self.stockfish_depth.get(),
-            self.memory.get(),
-            self.cpu_threads.get(),
+        # Start profiling the GUI, bot and overlay processes
+        self.game_id += 1
+        self.log_context.game_id = self.game_id
+        tag = None
+        if self.enable_profiling.get() == 1:
+            tag = profile_tag(self.session_id, self.game_id)
+            self.gui_profiler = SamplingProfiler("gui", tag)
+            self.gui_profiler.start()
+
+        # Take the parked Stockfish Bot and overlay processes, with the
+        # pipe used for the communication between the GUI and the bot
+        self.start_time = time.perf_counter()
+        bot_worker, self.stockfish_bot_pipe, overlay_worker = self.worker_pool.take(
+            self.state, self.engine_pipe, self.log_queue
         )
-        self.stockfish_bot_process.start()
 
-        # Create the overlay
-        self.overlay_screen_process = multiprocessing.Process(
-            target=run, args=(st_ov_queue,)
-        )
-        self.overlay_screen_process.start()
+        # Start the Stockfish Bot with the options
+        bot_worker.launch({
+            "chrome_url": self.chrome_url,
+            "chrome_session_id": self.chrome_session_id,
+            "chrome_debugger_address": self.chrome_debugger_address,
+            "website": self.website.get(),
+            "enable_manual_mode": self.enable_manual_mode.get() == 1,
+            "enable_mouseless_mode": self.enable_mouseless_mode.get() == 1,
+            "input_backend": self.input_backend.get(),
+            "enable_screen_grabber": self.enable_screen_grabber.get() == 1,
+            "enable_socket_grabber": self.enable_socket_grabber.get() == 1,
+            "enable_non_stop_puzzles": self.enable_non_stop_puzzles.get() == 1,
+            "enable_early_stop": self.enable_early_stop.get() == 1,
+            "enable_fast_path": self.enable_fast_path.get() == 1,
+            "enable_recording": self.enable_recording.get() == 1,
+            "bongcloud": self.enable_bongcloud.get() == 1,
+            "slow_mover": self.slow_mover.get(),
+            "skill_level": self.skill_level.get(),
+            "stockfish_depth": self.stockfish_depth.get(),
+            "memory": self.memory.get(),
+            "cpu_threads": self.cpu_threads.get(),
+            "speculation_threads": self.speculation_threads.get(),
+            "profile_tag": tag,
+            "log_context": ContextFilter(self.session_id, self.game_id),
+        })
+        self.stockfish_bot_process = bot_worker
+
+        # Start the overlay
+        overlay_worker.launch({"profile_tag": tag, "log_context": ContextFilter(self.session_id, self.game_id)})
+        self.overlay_screen_process = overlay_worker
+
+        self.apply_process_placement()
 
         # Update the run button
         self.running = True
@@ -664,6 +948,11 @@ class GUI:
         self.start_button.update()
 
     def on_stop_button_listener(self):
+        # Write the GUI profile
+        if self.gui_profiler is not None:
+            self.gui_profiler.stop()
+            self.gui_profiler = None
+
         # Stop the Stockfish Bot process
         if self.stockfish_bot_process is not None:
             self.stockfish_bot_process.kill()
@@ -713,21 +1002,22 @@ class GUI:
             return
 
         # Write the PGN to the file
+        match_moves = moves_to_san(self.state.get_moves()[1])
         data = ""
-        for i in range(len(self.match_moves) // 2 + 1):
-            if len(self.match_moves) % 2 == 0 and i == len(self.match_moves) // 2:
+        for i in range(len(match_moves) // 2 + 1):
+            if len(match_moves) % 2 == 0 and i == len(match_moves) // 2:
                 continue
             data += str(i + 1) + ". "
-            data += self.match_moves[i * 2] + " "
-            if (i * 2) + 1 < len(self.match_moves):
-                data += self.match_moves[i * 2 + 1] + " "
+            data += match_moves[i * 2] + " "
+            if (i * 2) + 1 < len(match_moves):
+                data += match_moves[i * 2 + 1] + " "
         f.write(data)
         f.close()
 
     def on_select_stockfish_button_listener(self):
         # Create the file dialog
         f = filedialog.askopenfilename()
-        if f is None:
+        if not f:
             return
 
         # Set the Stockfish path
@@ -735,6 +1025,152 @@ class GUI:
         self.stockfish_path_text["text"] = self.stockfish_path
         self.stockfish_path_text.update()
 
+        # Use the setting found by a previous auto-tune
+        tuned = load_tuned_parameters(self.stockfish_path)
+        if tuned is not None:
+            self.cpu_threads.set(tuned["threads"])
+            self.memory.set(tuned["hash"])
+            logging.info(f"Using the auto-tuned setting: {tuned['threads']} threads, {tuned['hash']} MB")
+
+        # Spawn the engine now so that it is ready when Start is pressed
+        self.start_engine_host()
+
+    def on_auto_tune_button_listener(self):
+        if self.stockfish_path == "" or self.engine_host_process is None:
+            tk.messagebox.showerror("Error", "Stockfish path is empty")
+            return
+        if self.running:
+            tk.messagebox.showerror("Error", "Stop the bot before auto-tuning")
+            return
+
+        self.tuning = True
+        self.auto_tune_button["state"] = "disabled"
+        auto_tune_thread = threading.Thread(target=self.auto_tune_thread, daemon=True)
+        auto_tune_thread.start()
+
+    # Searches a few positions with several Threads/Memory settings,
+    # then restarts the engine with the fastest one and stores it
+    def auto_tune_thread(self):
+        def on_progress(done, total, result):
+            self.auto_tune_button["text"] = f"Auto-tuning... {done}/{total}"
+            logging.info(f"Auto-tune: {result['threads']} threads, {result['hash']} MB: {result['time']:.2f}s, {result['nps']} nps")
+
+        try:
+            best = auto_tune(EngineClient(self.engine_pipe), on_progress)
+            save_tuned_parameters(self.stockfish_path, best)
+            self.cpu_threads.set(best["threads"])
+            self.memory.set(best["hash"])
+            logging.info(f"Auto-tune: using {best['threads']} threads, {best['hash']} MB")
+        except Exception:
+            logging.exception("Auto-tune failed")
+
+        self.tuning = False
+        self.auto_tune_button["text"] = "Auto-tune Threads/Memory"
+        self.auto_tune_button["state"] = "normal"
+        self.start_engine_host()
+
+    # Returns the pids watched by the resource monitor
+    def get_pids_by_role(self):
+        bot_process = self.stockfish_bot_process
+        overlay_process = self.overlay_screen_process
+        engine_host_process = self.engine_host_process
+        return {
+            "gui": [os.getpid()],
+            "engine": [engine_host_process.pid if engine_host_process is not None else None],
+            "browser": [self.get_chromedriver_pid()],
+            "bot": [bot_process.pid if bot_process is not None else None],
+            "overlay": [overlay_process.pid if overlay_process is not None else None],
+        }
+
+    # Shows the last resource monitor samples
+    # Ex. "bot: 85 MB, 3% CPU"
+    def show_resources(self, samples):
+        lines = [f"{role}: {rss_mb:.0f} MB, {cpu:.0f}% CPU" for role, (count, rss_mb, cpu) in samples.items()]
+        self.resources_text["text"] = "\n".join(lines)
+
+    # The recycle action runs before the next game starts
+    def on_resource_threshold(self, role, rss_mb):
+        self.recycle_pending = True
+
+    # Reloads the page or restarts the engine (see resource_monitor.RECYCLE)
+    def recycle(self):
+        self.recycle_pending = False
+        logging.info(f"Recycling: {RECYCLE['action']}")
+        if RECYCLE["action"] == "reload" and self.chrome is not None:
+            try:
+                self.chrome.refresh()
+            except WebDriverException:
+                logging.exception("Failed to reload the page")
+        elif RECYCLE["action"] == "restart_engine" and self.stockfish_path != "":
+            self.start_engine_host()
+
+    # Pins the engine to its own cores and the bot, GUI, overlay and
+    # browser to the other ones (see placement.py)
+    def apply_process_placement(self):
+        if self.available_cores is None:
+            return
+
+        if self.enable_placement.get() == 1:
+            plan = plan_placement(self.available_cores, self.cpu_threads.get())
+            self.placement_applied = True
+            self.placement_text["text"] = f"Engine: cores {format_cores(plan['engine'])}\nOthers: cores {format_cores(plan['other'])}"
+        elif self.placement_applied:
+            # Undo the placement of the processes that outlive a game
+            plan = {"other": self.available_cores}
+            self.placement_applied = False
+            self.placement_text["text"] = ""
+        else:
+            return
+
+        apply_plan(plan, {
+            "gui": [os.getpid()],
+            "engine": [self.engine_host_process.pid if self.engine_host_process is not None else None],
+            "browser": [self.get_chromedriver_pid()],
+            "bot": [self.stockfish_bot_process.pid],
+            "overlay": [self.overlay_screen_process.pid],
+        })
+        logging.info(f"Process placement: {plan}")
+
+    # Starts the Stockfish process for the selected path,
+    # replacing the previous one if it exists
+    def start_engine_host(self):
+        # The running bot is using the old engine
+        if self.running:
+            self.on_stop_button_listener()
+        self.stop_engine_host()
+
+        parameters = engine_parameters(
+            self.slow_mover.get(),
+            self.skill_level.get(),
+            self.memory.get(),
+            self.cpu_threads.get(),
+        )
+        self.engine_pipe, child_conn = multiprocessing.Pipe()
+        self.engine_host_process = EngineHost(
+            child_conn,
+            self.stockfish_path,
+            self.stockfish_depth.get(),
+            parameters,
+            self.log_queue,
+            ContextFilter(self.session_id),
+        )
+        self.engine_host_process.start()
+        logging.info("Engine pre-warm started")
+
+        # The parked bot worker talks to this engine
+        self.worker_pool.park(self.state, self.engine_pipe, self.log_queue)
+
+    def stop_engine_host(self):
+        self.worker_pool.stop()
+
+        if self.engine_host_process is not None:
+            self.engine_host_process.kill()
+            self.engine_host_process = None
+
+        if self.engine_pipe is not None:
+            self.engine_pipe.close()
+            self.engine_pipe = None
+
     # Clears the Treeview
     def clear_tree(self):
         self.tree.delete(*self.tree.get_children())
@@ -777,6 +1213,12 @@ class GUI:
 
 
 if __name__ == "__main__":
+    log_queue = multiprocessing.Queue()
+    log_context = ContextFilter(time.strftime("%Y%m%d-%H%M%S"))
+    log_listener = setup_logging(log_queue, log_context)
+
     window = tk.Tk()
-    my_gui = GUI(window)
+    my_gui = GUI(window, log_queue, log_context)
     window.mainloop()
+
+    log_listener.stop()
@@ -0,0 +1,46 @@
+import time
+
+from inputs.input_backend import InputBackend
+from utilities import execute_cdp_cmd
+
+
+# Sends the mouse events straight to the page through the Chrome
+# DevTools Input.dispatchMouseEvent command. The real mouse is not
+# moved, so it also works while the browser is in the background
+class CdpInputBackend(InputBackend):
+    # The promotion window is rendered after the drop is handled
+    promotion_delay = 0.03
+
+    def __init__(self, grabber, is_white):
+        super().__init__(grabber, is_white, "cdp")
+
+    def get_board_geometry(self):
+        # The events use viewport coordinates in CSS pixels
+        rect = self.grabber.chrome.execute_script(
+            "const r = arguments[0].getBoundingClientRect(); return [r.left, r.top, r.width];",
+            self.grabber.get_board()
+        )
+        return (rect[0], rect[1]), rect[2] / 8
+
+    def dispatch(self, event_type, pos, buttons):
+        execute_cdp_cmd(self.grabber.chrome, "Input.dispatchMouseEvent", {
+            "type": event_type,
+            "x": pos[0],
+            "y": pos[1],
+            "button": "none" if event_type == "mouseMoved" and buttons == 0 else "left",
+            "buttons": buttons,
+            "clickCount": 1,
+        })
+
+    def drag(self, start_pos, end_pos):
+        self.dispatch("mouseMoved", start_pos, 0)
+        self.dispatch("mousePressed", start_pos, 1)
+        self.dispatch("mouseMoved", end_pos, 1)
+        self.dispatch("mouseReleased", end_pos, 0)
+
+    def click(self, pos):
+        self.dispatch("mousePressed", pos, 1)
+        self.dispatch("mouseReleased", pos, 0)
+
+    def wait_for_promotion_window(self):
+        time.sleep(self.promotion_delay)
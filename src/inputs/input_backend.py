@@ -0,0 +1,69 @@
+import time
+from abc import ABC, abstractmethod
+
+from utilities import char_to_num, LatencyStats
+
+# Number of squares between the promotion square and
+# the piece in the promotion window (the window always
+# opens from the promotion square towards the player)
+PROMOTION_OFFSETS = {"q": 0, "n": 1, "r": 2, "b": 3}
+
+
+# Base abstract class for the different ways of making moves on the board
+class InputBackend(ABC):
+    def __init__(self, grabber, is_white, name):
+        self.grabber = grabber
+        self.is_white = is_white
+        self.stats = LatencyStats("input[" + name + "]")
+
+    # Returns the board top left corner and the square size
+    # in the coordinate space of the backend
+    # Ex. ((x, y), square_size)
+    @abstractmethod
+    def get_board_geometry(self):
+        pass
+
+    # Presses at start_pos, moves to end_pos and releases there
+    @abstractmethod
+    def drag(self, start_pos, end_pos):
+        pass
+
+    # Clicks at pos
+    @abstractmethod
+    def click(self, pos):
+        pass
+
+    # Converts a square to a position using the board geometry
+    # Example: "a1" -> (x, y)
+    def square_to_pos(self, geometry, square, rows_down=0):
+        (board_x, board_y), square_size = geometry
+
+        # Depending on the player color, the board is flipped, so the coordinates need to be adjusted
+        if self.is_white:
+            x = board_x + square_size * (char_to_num(square[0]) - 1) + square_size / 2
+            y = board_y + square_size * (8 - int(square[1]) + rows_down) + square_size / 2
+        else:
+            x = board_x + square_size * (8 - char_to_num(square[0])) + square_size / 2
+            y = board_y + square_size * (int(square[1]) - 1 + rows_down) + square_size / 2
+
+        return x, y
+
+    # Waits for the promotion window to open
+    def wait_for_promotion_window(self):
+        pass
+
+    # Makes the move and records how long it took
+    # Example: "e7e8q"
+    def make_move(self, move):
+        start_time = time.perf_counter()
+
+        geometry = self.get_board_geometry()
+        self.drag(self.square_to_pos(geometry, move[0:2]), self.square_to_pos(geometry, move[2:4]))
+
+        # Check for promotion. If there is a promotion,
+        # promote to the corresponding piece type
+        if len(move) == 5:
+            self.wait_for_promotion_window()
+            self.click(self.square_to_pos(geometry, move[2:4], PROMOTION_OFFSETS[move[4]]))
+
+        self.stats.add(time.perf_counter() - start_time)
@@ -0,0 +1,34 @@
+import time
+
+import pyautogui
+
+from inputs.input_backend import InputBackend
+
+
+# Moves the physical mouse
+class PyautoguiInputBackend(InputBackend):
+    def __init__(self, grabber, is_white):
+        super().__init__(grabber, is_white, "pyautogui")
+
+    def get_board_geometry(self):
+        # Get the absolute top left corner of the website
+        canvas_x_offset, canvas_y_offset = self.grabber.get_top_left_corner()
+
+        # Get the absolute board position
+        board = self.grabber.get_board()
+        location = board.location
+        board_x = canvas_x_offset + location["x"]
+        board_y = canvas_y_offset + location["y"]
+
+        return (board_x, board_y), board.size["width"] / 8
+
+    def drag(self, start_pos, end_pos):
+        pyautogui.moveTo(start_pos[0], start_pos[1])
+        pyautogui.dragTo(end_pos[0], end_pos[1])
+
+    def click(self, pos):
+        pyautogui.moveTo(x=pos[0], y=pos[1])
+        pyautogui.click(button='left')
+
+    def wait_for_promotion_window(self):
+        time.sleep(0.1)
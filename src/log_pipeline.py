@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+LOG_FILE = "chess_bot.log"
+
+# Set to 1 to log every ply (rate limited) at the DEBUG level
+PLY_LOG_ENV_VAR = "CHESS_BOT_PLY_LOG"
+
+# Minimum time between two records with the same message on the ply logger
+PLY_LOG_INTERVAL = 0.5
+
+# Attributes that every LogRecord has, the others were passed with extra=
+RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+# Formats the records as one JSON object per line
+# Ex. {"time": "2026-10-19 10:15:00.123", "level": "INFO", "process": "StockfishBot-1", ...}
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record.created)) + ".%03d" % record.msecs,
+            "level": record.levelname,
+            "process": record.processName,
+            "pid": record.process,
+            "thread": record.threadName,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in RECORD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, default=str)
+
+
+# Adds the session and game ids to the records, so that
+# the records of all the processes can be correlated
+class ContextFilter(logging.Filter):
+    def __init__(self, session_id, game_id=0):
+        super().__init__()
+        self.session_id = session_id
+        self.game_id = game_id
+
+    def filter(self, record):
+        record.session = self.session_id
+        record.game = self.game_id
+        return True
+
+
+# Lets through at most one record with the same message every interval seconds
+class RateLimitFilter(logging.Filter):
+    def __init__(self, interval):
+        super().__init__()
+        self.interval = interval
+        self.last_times = {}
+
+    def filter(self, record):
+        now = time.monotonic()
+        last_time = self.last_times.get(record.msg)
+        if last_time is not None and now - last_time < self.interval:
+            return False
+        self.last_times[record.msg] = now
+        return True
+
+
+# Returns the logger used for the per-ply events
+# Ex. get_ply_logger().debug("ply", extra={"ply": 12, "move": "Nf3"})
+def get_ply_logger():
+    logger = logging.getLogger("chess_bot.ply")
+    if not logger.filters:
+        logger.addFilter(RateLimitFilter(PLY_LOG_INTERVAL))
+        if os.environ.get(PLY_LOG_ENV_VAR, "0") not in ("", "0"):
+            logger.setLevel(logging.DEBUG)
+    return logger
+
+
+# Sends the records of the current process to the log queue,
+# so logging never waits for the disk
+def setup_process_logging(log_queue, context_filter):
+    logger = logging.getLogger()
+    logger.setLevel(logging.INFO)
+    for handler in logger.handlers[:]:
+        logger.removeHandler(handler)
+
+    handler = QueueHandler(log_queue)
+    handler.addFilter(context_filter)
+    logger.addHandler(handler)
+
+
+# Sets up the GUI process as the only writer of the log. The records of
+# every process go through log_queue to a listener thread that writes
+# them as JSON to the rotating log file and as text to console_stream
+# Returns the started QueueListener
+def setup_logging(log_queue, context_filter, console_stream=None):
+    file_handler = RotatingFileHandler(
+        LOG_FILE,
+        maxBytes=1024*1024,  # 1MB
+        backupCount=3,
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    # Log também para stdout
+    console_handler = logging.StreamHandler(console_stream or sys.stdout)
+    console_handler.setFormatter(logging.Formatter(
+        '%(asctime)s - %(processName)s - %(levelname)s - %(message)s',
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+
+    listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    listener.start()
+
+    setup_process_logging(log_queue, context_filter)
+    return listener
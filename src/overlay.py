@@ -1,3 +1,4 @@
+import logging
 import math
 import sys
 import threading
@@ -5,11 +6,15 @@ from PyQt5.QtCore import Qt, QPoint
 from PyQt5.QtGui import QBrush, QColor, QPainter, QPen, QGuiApplication, QPolygon
 from PyQt5.QtWidgets import QApplication, QWidget
 
+from profiler import SamplingProfiler
+from resource_monitor import is_tracemalloc_enabled_by_env, start_tracemalloc_snapshots
+from log_pipeline import setup_process_logging
+
 
 class OverlayScreen(QWidget):
-    def __init__(self, stockfish_queue):
+    def __init__(self, state):
         super().__init__()
-        self.stockfish_queue = stockfish_queue
+        self.state = state
 
         # Set the window to be the size of the screen
         self.screen = QGuiApplication.screens()[0]
@@ -30,7 +35,7 @@ class OverlayScreen(QWidget):
 
     def message_queue_thread(self):
         """
-        This thread is used to receive messages from the stockfish message queue
+        This thread is used to wait for changes of the shared state
         and update the arrows
         Args:
             None
@@ -38,9 +43,13 @@ class OverlayScreen(QWidget):
             None
         """
 
+        arrows = None
         while True:
-            message = self.stockfish_queue.get()
-            self.set_arrows(message)
+            self.state.wait("overlay")
+            new_arrows = self.state.get_arrows()
+            if new_arrows != arrows:
+                arrows = new_arrows
+                self.set_arrows(arrows)
 
     def set_arrows(self, arrows):
         """
@@ -108,20 +117,37 @@ class OverlayScreen(QWidget):
             start_right = QPoint(int(start_point.x() - (arrow_height / 5) * perp_x), int(start_point.y() - (arrow_height / 5) * perp_y))
 
             return QPolygon([end_point, point2, mid_point1, start_right, start_left, mid_point2, point3])
-        except Exception as e:
-            print(e)
+        except Exception:
+            logging.exception("Could not build the arrow polygon")
 
 
-def run(stockfish_queue):
+def run(state, profile_tag=None, log_queue=None, log_context=None):
     """
     This function is used to run the overlay
     Args:
-        stockfish_queue: The message queue used to communicate with the stockfish thread
+        state: The SharedState written by the Stockfish Bot process
+        profile_tag: If not None, the overlay is profiled and the
+        profile file names start with this tag
+        log_queue: The queue the log records are sent to the GUI process through
+        log_context: The ContextFilter with the session and game ids
     Returns:
         None
     """
 
+    if log_queue is not None:
+        setup_process_logging(log_queue, log_context)
+
+    profiler = None
+    if profile_tag is not None:
+        profiler = SamplingProfiler("overlay", profile_tag)
+        profiler.start()
+    if log_context is not None and is_tracemalloc_enabled_by_env():
+        start_tracemalloc_snapshots(log_context.session_id, "overlay")
+
     app = QApplication(sys.argv)
-    overlay = OverlayScreen(stockfish_queue)
+    overlay = OverlayScreen(state)
     overlay.show()
     app.exec()
+
+    if profiler is not None:
+        profiler.stop()
@@ -0,0 +1,194 @@
+import argparse
+import multiprocessing
+import os
+import time
+
+# Overrides the core sets of the placement
+# Ex. CHESS_BOT_PLACEMENT="engine=4-7;other=0-3"
+PLACEMENT_ENV_VAR = "CHESS_BOT_PLACEMENT"
+
+# Nice level of every process role. Only raising the nice level is
+# allowed without privileges, so the processes that don't need to react
+# fast (GUI, overlay) are lowered instead of the engine being raised
+NICENESS = {
+    "engine": 0,
+    "bot": 0,
+    "browser": 0,
+    "gui": 5,
+    "overlay": 5,
+}
+
+
+# CPU affinity is only available on Linux
+def is_placement_supported():
+    return hasattr(os, "sched_setaffinity") and os.path.isdir("/proc")
+
+
+def get_available_cores():
+    return sorted(os.sched_getaffinity(0))
+
+
+# Parses a core list
+# Ex. "0-3,6" -> [0, 1, 2, 3, 6]
+def parse_cores(text):
+    cores = []
+    for part in text.split(","):
+        if "-" in part:
+            start, end = part.split("-")
+            cores.extend(range(int(start), int(end) + 1))
+        elif part:
+            cores.append(int(part))
+    return cores
+
+
+# Formats a core list
+# Ex. [0, 1, 2, 3, 6] -> "0-3,6"
+def format_cores(cores):
+    ranges = []
+    for core in sorted(cores):
+        if ranges and core == ranges[-1][1] + 1:
+            ranges[-1][1] = core
+        else:
+            ranges.append([core, core])
+    return ",".join(str(start) if start == end else f"{start}-{end}" for start, end in ranges)
+
+
+# Splits the cores between the engine threads and the other processes
+# (bot, GUI, overlay and browser). The engine gets the last engine_threads
+# cores, and at least one core is left for the others
+# Returns {"engine": [...], "other": [...]}
+def plan_placement(cores, engine_threads):
+    override = os.environ.get(PLACEMENT_ENV_VAR, "")
+    if override:
+        plan = {}
+        for entry in override.split(";"):
+            role, core_list = entry.split("=")
+            plan[role.strip()] = parse_cores(core_list.strip())
+        return plan
+
+    if len(cores) < 2:
+        return {"engine": list(cores), "other": list(cores)}
+    engine_count = max(1, min(engine_threads, len(cores) - 1))
+    return {"engine": cores[-engine_count:], "other": cores[:-engine_count]}
+
+
+# Returns the pid and the pids of all the descendants of a process
+def get_process_tree(pid):
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The name is in parentheses and can contain spaces
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+
+    pids = [pid]
+    for current in pids:
+        pids.extend(children.get(current, []))
+    return pids
+
+
+# Pins every thread of the process (and of its descendants if children
+# is True) to cores and sets their nice level. The threads created later
+# inherit the placement
+# Returns the number of threads placed
+def apply_placement(pid, cores, niceness=None, children=True):
+    placed = 0
+    for process_id in get_process_tree(pid) if children else [pid]:
+        try:
+            thread_ids = [int(tid) for tid in os.listdir(f"/proc/{process_id}/task")]
+        except OSError:
+            continue
+
+        for thread_id in thread_ids:
+            try:
+                os.sched_setaffinity(thread_id, cores)
+            except OSError:
+                # The thread exited
+                continue
+            placed += 1
+
+            if niceness is not None:
+                try:
+                    os.setpriority(os.PRIO_PROCESS, thread_id, niceness)
+                except OSError:
+                    # Lowering the nice level needs privileges
+                    pass
+    return placed
+
+
+# Applies the plan to the processes of each role. The engine (Stockfish
+# runs in a child of the engine host) and the browser (chromedriver starts
+# Chrome) are placed with their descendants
+# Ex. apply_plan(plan, {"engine": [engine_pid], "bot": [bot_pid], "gui": [os.getpid()]})
+def apply_plan(plan, pids_by_role):
+    for role, pids in pids_by_role.items():
+        cores = plan.get(role, plan["other"])
+        for pid in pids:
+            if pid is not None:
+                apply_placement(pid, cores, NICENESS.get(role), children=role in ("engine", "browser"))
+
+
+# Keeps a core busy, like a browser tab rendering
+def busy_loop(stop_time):
+    while time.monotonic() < stop_time:
+        pass
+
+
+# Measures the search latency of the engine with every core loaded by
+# busy processes, without and with the placement, to show the effect on
+# the p95 latency
+# Ex. python placement.py <stockfish path> --threads 2
+def benchmark(stockfish_path, engine_threads, searches, depth):
+    from engines.auto_tune import TUNE_POSITIONS
+    from engines.engine_host import EngineClient, EngineHost, engine_parameters
+    from utilities import LatencyStats
+
+    cores = get_available_cores()
+    plan = plan_placement(cores, engine_threads)
+    print(f"engine: {format_cores(plan['engine'])}, other: {format_cores(plan['other'])}")
+
+    for pinned in (False, True):
+        engine_pipe, child_conn = multiprocessing.Pipe()
+        engine_host = EngineHost(child_conn, stockfish_path, depth, engine_parameters(100, 20, 64, engine_threads))
+        engine_host.start()
+        engine = EngineClient(engine_pipe)
+        engine.get_status()
+
+        # The load is pinned to the other cores like the browser would be
+        stop_time = time.monotonic() + 3600
+        load = [multiprocessing.Process(target=busy_loop, args=(stop_time,), daemon=True) for _ in cores]
+        for process in load:
+            process.start()
+        if pinned:
+            apply_plan(plan, {"engine": [engine_host.pid], "browser": [process.pid for process in load]})
+
+        stats = LatencyStats("pinned" if pinned else "unpinned")
+        for i in range(searches):
+            engine.set_fen_position(TUNE_POSITIONS[i % len(TUNE_POSITIONS)])
+            start_time = time.perf_counter()
+            engine.search(depth=depth)
+            stats.add(time.perf_counter() - start_time)
+        print(stats.summary())
+
+        for process in load:
+            process.kill()
+        engine_host.kill()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measures the search latency with and without the process placement")
+    parser.add_argument("stockfish")
+    parser.add_argument("--threads", type=int, default=2)
+    parser.add_argument("--searches", type=int, default=20)
+    parser.add_argument("--depth", type=int, default=14)
+    arguments = parser.parse_args()
+
+    if not is_placement_supported():
+        print("CPU affinity is not supported on this system")
+    else:
+        benchmark(arguments.stockfish, arguments.threads, arguments.searches, arguments.depth)
@@ -0,0 +1,80 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+# Set to 1 to profile the bot, the overlay and the GUI without using the GUI check button
+PROFILE_ENV_VAR = "CHESS_BOT_PROFILE"
+
+PROFILES_DIR = "profiles"
+
+
+def is_profiling_enabled_by_env():
+    return os.environ.get(PROFILE_ENV_VAR, "0") not in ("", "0")
+
+
+# Returns a tag used in the profile file names
+# Ex. "20261019-101500-g3"
+def profile_tag(session_id, game_id):
+    return f"{session_id}-g{game_id}"
+
+
+# Samples the stacks of all the threads of the current process from a
+# background thread and writes them in the collapsed stack format
+# (one "root;caller;function count" line per stack), which flamegraph.pl
+# and speedscope can open. The file is rewritten every flush_interval
+# seconds, so a killed process loses at most the last few seconds
+class SamplingProfiler:
+    def __init__(self, process_name, tag, interval=0.005, flush_interval=5):
+        self.path = os.path.join(PROFILES_DIR, f"{tag}-{process_name}-{os.getpid()}.folded")
+        self.interval = interval
+        self.flush_interval = flush_interval
+        self.stacks = Counter()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.sampler_thread, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+        self.write()
+
+    def sampler_thread(self):
+        own_id = threading.get_ident()
+        thread_names = {}
+        last_flush = time.monotonic()
+
+        while self.running:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+
+                if thread_id not in thread_names:
+                    thread_names = {thread.ident: thread.name for thread in threading.enumerate()}
+                stack.append(thread_names.get(thread_id, str(thread_id)))
+                self.stacks[";".join(reversed(stack))] += 1
+
+            if time.monotonic() - last_flush >= self.flush_interval:
+                self.write()
+                last_flush = time.monotonic()
+
+            time.sleep(self.interval)
+
+    def write(self):
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        with open(self.path, "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
@@ -0,0 +1,109 @@
+import os
+import sys
+import threading
+import time
+
+import chess
+
+# The moves of the recorded game (UCI, space separated)
+MOVES_ENV_VAR = "REPLAY_MOVES"
+
+# Time spent "thinking" per depth
+DEPTH_TIME = 0.001
+
+
+# A UCI engine that plays the moves of a recorded game, so the replayed
+# games are deterministic and don't depend on the Stockfish version.
+# It implements what python-stockfish and the engine host use: uci,
+# isready, setoption, ucinewgame, position, go, stop, d and quit.
+# python-stockfish sends the positions as FENs, so the recorded moves are
+# looked up by FEN (the move number tells repeated positions apart).
+# If the position left the recorded game, the first legal move is played
+class FakeEngine:
+    def __init__(self, moves):
+        self.recorded_moves = {}
+        board = chess.Board()
+        for move in moves:
+            self.recorded_moves[board.fen()] = move
+            board.push_uci(move)
+
+        self.board = chess.Board()
+        self.stop_event = threading.Event()
+        self.search_thread = None
+        self.output_lock = threading.Lock()
+
+    def output(self, line):
+        with self.output_lock:
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def get_move(self):
+        move = self.recorded_moves.get(self.board.fen())
+        if move is not None:
+            return move
+        for move in self.board.legal_moves:
+            return move.uci()
+        return None
+
+    def search(self, depth):
+        move = self.get_move()
+        for current_depth in range(1, depth + 1):
+            if self.stop_event.is_set() or move is None:
+                break
+            time.sleep(DEPTH_TIME)
+            self.output(f"info depth {current_depth} seldepth {current_depth} multipv 1 score cp 0 nodes 1 nps 1000 time 1 pv {move}")
+        self.output(f"bestmove {move or '(none)'}")
+
+    def set_position(self, tokens):
+        if tokens[1] == "startpos":
+            self.board = chess.Board()
+        else:
+            self.board = chess.Board(" ".join(tokens[2:8]))
+        if "moves" in tokens:
+            for move in tokens[tokens.index("moves") + 1:]:
+                self.board.push_uci(move)
+
+    def wait_for_search(self):
+        if self.search_thread is not None:
+            self.search_thread.join()
+            self.search_thread = None
+
+    def run(self):
+        self.output("Stockfish 16 replay engine")
+        for line in sys.stdin:
+            tokens = line.split()
+            if not tokens:
+                continue
+
+            command = tokens[0]
+            if command == "uci":
+                self.output("id name Stockfish 16")
+                self.output("uciok")
+            elif command == "isready":
+                self.output("readyok")
+            elif command == "ucinewgame":
+                self.board = chess.Board()
+            elif command == "position":
+                self.wait_for_search()
+                self.set_position(tokens)
+            elif command == "go":
+                self.wait_for_search()
+                self.stop_event.clear()
+                depth = int(tokens[tokens.index("depth") + 1]) if "depth" in tokens else 10
+                self.search_thread = threading.Thread(target=self.search, args=(depth,))
+                self.search_thread.start()
+            elif command == "stop":
+                self.stop_event.set()
+            elif command == "d":
+                self.output(f"Fen: {self.board.fen()}")
+                checkers = " ".join(chess.square_name(square) for square in self.board.checkers())
+                self.output(f"Checkers: {checkers}")
+            elif command == "quit":
+                break
+
+        self.stop_event.set()
+        self.wait_for_search()
+
+
+if __name__ == "__main__":
+    FakeEngine(os.environ.get(MOVES_ENV_VAR, "").split()).run()
@@ -0,0 +1,194 @@
+import argparse
+import logging
+import os
+import stat
+import sys
+import tempfile
+import time
+
+import multiprocessing
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service as ChromeService
+from webdriver_manager.chrome import ChromeDriverManager
+
+from engines.engine_host import EngineHost, engine_parameters
+from log_pipeline import ContextFilter, setup_logging
+from replay.fake_engine import MOVES_ENV_VAR
+from replay.recorder import load_recording
+from replay.server import ReplayServer
+from shared_state import SharedState
+from stockfish_bot import StockfishBot
+
+# Engine options of the replayed games
+REPLAY_DEPTH = 8
+REPLAY_PARAMETERS = engine_parameters(slow_mover=100, skill_level=20, memory=16, cpu_threads=1)
+
+# Time allowed for the bot to report START and to finish the game
+START_TIMEOUT = 60
+GAME_TIMEOUT = 600
+
+
+# Writes an executable that runs the fake engine, since
+# python-stockfish takes the path of an executable
+def write_engine_launcher(directory):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_engine.py")
+    if os.name == "nt":
+        path = os.path.join(directory, "fake_engine.bat")
+        content = f'@"{sys.executable}" "{script}" %*\r\n'
+    else:
+        path = os.path.join(directory, "fake_engine.sh")
+        content = f'#!/bin/sh\nexec "{sys.executable}" "{script}" "$@"\n'
+
+    with open(path, "w") as f:
+        f.write(content)
+    os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+    return path
+
+
+def open_browser(headless):
+    options = webdriver.ChromeOptions()
+    options.add_experimental_option("excludeSwitches", ["enable-logging"])
+    if headless:
+        options.add_argument("--headless=new")
+    return webdriver.Chrome(service=ChromeService(ChromeDriverManager().install()), options=options)
+
+
+# Compares the moves the bot saw with the recorded ones
+# Returns the list of (ply, expected, seen) differences
+def find_desyncs(recorded_moves, seen_moves):
+    desyncs = []
+    for ply in range(max(len(recorded_moves), len(seen_moves))):
+        expected = recorded_moves[ply] if ply < len(recorded_moves) else None
+        seen = seen_moves[ply] if ply < len(seen_moves) else None
+        if expected != seen:
+            desyncs.append((ply + 1, expected, seen))
+    return desyncs
+
+
+# Replays a recording with StockfishBot.run against a local stand-in of
+# the site, with the fake engine playing the recorded moves
+# Returns {"moves", "moves_per_second", "latencies", "desyncs", "submitted"}
+# where latencies are the times between an opponent move appearing in
+# the page and the bot sharing it, in seconds
+def run_replay(recording_path, speed=1.0, headless=True):
+    recording = load_recording(recording_path)
+    server = ReplayServer(recording, speed)
+    server.start()
+
+    log_queue = multiprocessing.Queue()
+    listener = setup_logging(log_queue, ContextFilter("replay-" + time.strftime("%Y%m%d-%H%M%S")))
+
+    work_dir = tempfile.mkdtemp(prefix="replay-")
+    os.environ[MOVES_ENV_VAR] = " ".join(recording["moves"])
+    engine_pipe, host_pipe = multiprocessing.Pipe()
+    engine_host = EngineHost(host_pipe, write_engine_launcher(work_dir), REPLAY_DEPTH, REPLAY_PARAMETERS)
+    engine_host.start()
+
+    chrome = open_browser(headless)
+    state = SharedState(["harness"])
+    bot = None
+    try:
+        chrome.get(server.url)
+
+        # The replayed game is played without the mouse: the lichess moves
+        # go to the socket stub and the chess.com clicks hit a static board
+        parent_conn, child_conn = multiprocessing.Pipe()
+        bot = StockfishBot(
+            chrome_url=chrome.service.service_url,
+            chrome_session_id=chrome.session_id,
+            chrome_debugger_address=None,
+            website=recording["site"],
+            pipe=child_conn,
+            state=state,
+            engine_pipe=engine_pipe,
+            enable_manual_mode=False,
+            enable_mouseless_mode=recording["site"] == "lichess",
+            input_backend="cdp",
+            enable_screen_grabber=False,
+            enable_socket_grabber=False,
+            enable_non_stop_puzzles=False,
+            enable_early_stop=False,
+            enable_fast_path=False,
+            enable_recording=False,
+            bongcloud=False,
+            slow_mover=100,
+            skill_level=20,
+            stockfish_depth=REPLAY_DEPTH,
+            memory=16,
+            cpu_threads=1,
+            speculation_threads=0,
+            profile_tag=None,
+            log_queue=log_queue,
+            log_context=ContextFilter("replay", 1),
+        )
+        bot.start()
+
+        if not parent_conn.poll(START_TIMEOUT):
+            raise RuntimeError("the bot did not start")
+        message = parent_conn.recv()
+        if message != "START":
+            raise RuntimeError(f"the bot did not start: {message}")
+
+        # Timestamp every ply the bot shares
+        start_plies = len(state.get_moves()[1])
+        ply_times = {}
+        deadline = time.perf_counter() + GAME_TIMEOUT
+        while True:
+            # Read once more after the bot exited for its last ply
+            running = bot.is_alive() and time.perf_counter() < deadline
+            state.wait("harness", 0.1)
+            now = time.perf_counter()
+            moves = state.get_moves()[1]
+            for ply in range(len(ply_times) + start_plies + 1, len(moves) + 1):
+                ply_times[ply] = now
+            if not running:
+                break
+
+        # Opponent plies revealed by the replay
+        bot_parity = 1 if recording["is_white"] else 0
+        latencies = [
+            ply_times[event["ply"]] - event["time"]
+            for event in server.get_events("step")
+            if event["ply"] in ply_times and event["ply"] % 2 != bot_parity
+        ]
+
+        seen_moves = [move.uci() for move in state.get_moves()[1]]
+        elapsed = max(ply_times.values()) - min(ply_times.values()) if len(ply_times) > 1 else 0.0
+        return {
+            "moves": len(ply_times),
+            "moves_per_second": (len(ply_times) - 1) / elapsed if elapsed > 0 else 0.0,
+            "latencies": latencies,
+            "desyncs": find_desyncs(recording["moves"], seen_moves),
+            "submitted": len(server.get_events("submit")),
+        }
+    finally:
+        if bot is not None and bot.is_alive():
+            bot.kill()
+        engine_host.kill()
+        chrome.quit()
+        server.stop()
+        state.close()
+        state.unlink()
+        listener.stop()
+
+
+# Replays a recording and fails if the bot desynced
+# Ex. python -m replay.harness recordings/20261019-101500-lichess.json.gz --speed 4
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replays a recorded game against the bot")
+    parser.add_argument("recording")
+    parser.add_argument("--speed", type=float, default=1.0, help="replay speed factor")
+    parser.add_argument("--show", action="store_true", help="show the browser window")
+    arguments = parser.parse_args()
+
+    result = run_replay(arguments.recording, arguments.speed, not arguments.show)
+
+    latencies = sorted(result["latencies"])
+    print(f"moves: {result['moves']} ({result['moves_per_second']:.2f}/s)")
+    if latencies:
+        print(f"detection latency: mean={sum(latencies) / len(latencies) * 1000:.1f}ms max={latencies[-1] * 1000:.1f}ms")
+    print(f"moves submitted to the socket: {result['submitted']}")
+    for ply, expected, seen in result["desyncs"]:
+        print(f"desync at ply {ply}: expected {expected}, seen {seen}")
+    logging.shutdown()
+    sys.exit(1 if result["desyncs"] else 0)
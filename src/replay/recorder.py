@@ -0,0 +1,92 @@
+import gzip
+import json
+import os
+import re
+import time
+
+RECORDINGS_DIR = "recordings"
+
+# Installed in the page: marks the move list container and stores a
+# snapshot of its content every time it changes
+RECORDER_SCRIPT = """
+const container = arguments[0];
+container.setAttribute('data-replay-container', '1');
+window.__recorder = {steps: [], start: performance.now()};
+const snapshot = () => window.__recorder.steps.push({
+    t: (performance.now() - window.__recorder.start) / 1000,
+    html: container.innerHTML
+});
+new MutationObserver(snapshot).observe(container, {childList: true, subtree: true, characterData: true});
+"""
+
+# Returns the snapshots taken since the last call
+FLUSH_SCRIPT = "return window.__recorder ? window.__recorder.steps.splice(0) : [];"
+
+
+# Removes what shouldn't run or be seen again when replaying:
+# the site scripts and the marks the grabbers add to the moves
+def clean_html(html):
+    html = re.sub(r"<script\b[^>]*>.*?</script>", "", html, flags=re.DOTALL | re.IGNORECASE)
+    return html.replace(' data-processed="true"', "")
+
+
+# Records what the grabbers see during a real game: the page when the
+# recording started and every change of the move list. The recording is
+# replayed offline by replay.harness
+# The file (gzipped JSON) contains:
+# {"site", "is_white", "html", "move_pattern", "steps": [{"t", "html"}], "final_html", "moves"}
+class SessionRecorder:
+    def __init__(self, grabber, website, is_white):
+        self.grabber = grabber
+        self.chrome = grabber.chrome
+        self.recording = {
+            "site": website,
+            "is_white": is_white,
+            "html": None,
+            "move_pattern": None,
+            "steps": [],
+            "final_html": None,
+            "moves": [],
+        }
+        self.path = os.path.join(RECORDINGS_DIR, time.strftime("%Y%m%d-%H%M%S") + "-" + website + ".json.gz")
+
+    # Returns True if the move list container was found
+    def start(self):
+        container = self.grabber.get_move_list_container()
+        if container is None:
+            return False
+
+        self.chrome.execute_script(RECORDER_SCRIPT, container)
+        self.recording["html"] = clean_html(self.chrome.execute_script("return document.documentElement.outerHTML;"))
+        return True
+
+    # Fetches the snapshots taken in the page
+    def flush(self):
+        for step in self.chrome.execute_script(FLUSH_SCRIPT):
+            step["html"] = clean_html(step["html"])
+            self.recording["steps"].append(step)
+
+    # Saves the recording. The final page is the game over state
+    def save(self, moves, final=False):
+        self.flush()
+        self.recording["moves"] = moves
+        if final:
+            self.recording["final_html"] = clean_html(self.chrome.execute_script("return document.body.innerHTML;"))
+
+        # A regular expression matching one move in the move list snapshots
+        site_grabber = getattr(self.grabber, "site_grabber", self.grabber)
+        tag_name = getattr(site_grabber, "tag_name", None)
+        if self.recording["site"] == "chesscom":
+            self.recording["move_pattern"] = r'data-ply="'
+        else:
+            default_tag_name = "move" if self.grabber.is_game_puzzles() else "kwdb"
+            self.recording["move_pattern"] = "<" + (tag_name or default_tag_name) + r"[\s>]"
+
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        with gzip.open(self.path, "wt", encoding="utf-8") as f:
+            json.dump(self.recording, f)
+
+
+def load_recording(path):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)
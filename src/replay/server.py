@@ -0,0 +1,162 @@
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stands in for the lichess socket: counts the moves the bot sends
+# and acknowledges them like the server
+LICHESS_STUB_SCRIPT = """
+window.__replay = {submitted: 0};
+window.lichess = {socket: {ws: {
+    listeners: [],
+    addEventListener: function (type, listener) {
+        if (type === 'message') this.listeners.push(listener);
+    },
+    send: function (data) {
+        window.__replay.submitted++;
+        fetch('/event', {method: 'POST', body: JSON.stringify({type: 'submit', data: data})});
+        const message = JSON.parse(data);
+        if (message.d && message.d.a !== undefined) {
+            const ack = {data: JSON.stringify({t: 'ack', d: message.d.a})};
+            setTimeout(() => this.listeners.forEach(listener => listener(ack)), 0);
+        }
+    },
+}}};
+"""
+
+# Replays the move list snapshots. The existing nodes are updated in place
+# (the attributes the grabbers add are kept), so the grabbers see the same
+# mutations as on the real site. The plies of the bot are only revealed
+# after the bot submitted them when the replay is gated
+REPLAY_SCRIPT = """
+function sync(oldNode, newNode) {
+    if (oldNode.nodeType !== Node.ELEMENT_NODE) {
+        if (oldNode.nodeValue !== newNode.nodeValue) oldNode.nodeValue = newNode.nodeValue;
+        return;
+    }
+    for (const attr of newNode.attributes) {
+        if (oldNode.getAttribute(attr.name) !== attr.value) oldNode.setAttribute(attr.name, attr.value);
+    }
+    const oldChildren = Array.from(oldNode.childNodes);
+    const newChildren = Array.from(newNode.childNodes);
+    newChildren.forEach((child, i) => {
+        const old = oldChildren[i];
+        if (!old) oldNode.appendChild(child.cloneNode(true));
+        else if (old.nodeType === child.nodeType && old.nodeName === child.nodeName) sync(old, child);
+        else oldNode.replaceChild(child.cloneNode(true), old);
+    });
+    for (let i = newChildren.length; i < oldChildren.length; i++) oldNode.removeChild(oldChildren[i]);
+}
+
+window.addEventListener('load', async () => {
+    const timeline = await (await fetch('/timeline')).json();
+    const container = document.querySelector('[data-replay-container]');
+    const report = (event) => fetch('/event', {method: 'POST', body: JSON.stringify(event)});
+    const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
+
+    let last = 0;
+    for (const step of timeline.steps) {
+        await sleep(Math.max(0, step.t - last) * 1000 / timeline.speed);
+        last = step.t;
+        while (timeline.gated && step.bot_ply && window.__replay.submitted < step.bot_ply) await sleep(2);
+
+        const template = document.createElement(container.tagName);
+        template.innerHTML = step.html;
+        sync(container, template);
+        report({type: 'step', ply: step.ply});
+    }
+
+    await sleep(500 / timeline.speed);
+    if (timeline.final_html) document.body.innerHTML = timeline.final_html;
+    report({type: 'end'});
+});
+"""
+
+
+# Builds the replay timeline from a recording: every step gets its ply
+# number and, for the plies of the bot, the number of moves the bot has
+# to have submitted before the step is shown
+def build_timeline(recording, speed, gated):
+    move_pattern = re.compile(recording["move_pattern"])
+    bot_parity = 1 if recording["is_white"] else 0
+    start_ply = len(move_pattern.findall(recording["html"]))
+
+    steps = []
+    previous_ply = start_ply
+    bot_plies = 0
+    for step in recording["steps"]:
+        ply = len(move_pattern.findall(step["html"]))
+        bot_ply = None
+        if ply > previous_ply and ply % 2 == bot_parity:
+            bot_plies += 1
+            bot_ply = bot_plies
+        steps.append({"t": step["t"], "html": step["html"], "ply": ply, "bot_ply": bot_ply})
+        previous_ply = max(previous_ply, ply)
+
+    return {"speed": speed, "gated": gated, "steps": steps, "final_html": recording["final_html"]}
+
+
+# Serves a recorded game on localhost and replays its move list changes
+# at the recorded speed times speed. The events reported by the page
+# (revealed plies, submitted moves, end) are stored with the time they
+# were received, so the harness can measure the detection latency
+class ReplayServer:
+    def __init__(self, recording, speed=1.0, gated=True, port=0):
+        self.recording = recording
+        self.timeline = build_timeline(recording, speed, gated and recording["site"] == "lichess")
+        self.events = []
+        self.events_lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), self.create_handler())
+        self.url = "http://127.0.0.1:%d/" % self.httpd.server_address[1]
+
+    # Returns the page with the replay scripts in front of the recorded content
+    def get_page(self):
+        scripts = "<script>" + REPLAY_SCRIPT + "</script>"
+        if self.recording["site"] == "lichess":
+            scripts = "<script>" + LICHESS_STUB_SCRIPT + "</script>" + scripts
+        return re.sub(r"<head([^>]*)>", lambda match: "<head" + match.group(1) + ">" + scripts, self.recording["html"], count=1)
+
+    def create_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/":
+                    self.send_body("text/html", server.get_page())
+                elif self.path == "/timeline":
+                    self.send_body("application/json", json.dumps(server.timeline))
+                else:
+                    self.send_error(404)
+
+            def do_POST(self):
+                received_time = time.perf_counter()
+                event = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                event["time"] = received_time
+                with server.events_lock:
+                    server.events.append(event)
+                self.send_body("application/json", "{}")
+
+            def send_body(self, content_type, body):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type + "; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def get_events(self, event_type):
+        with self.events_lock:
+            return [event for event in self.events if event["type"] == event_type]
+
+    def start(self):
+        server_thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        server_thread.start()
+
+    def stop(self):
+        self.httpd.shutdown()
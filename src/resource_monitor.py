@@ -0,0 +1,150 @@
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+import psutil
+
+MONITOR_DIR = "monitor"
+
+# Set to 1 to write tracemalloc snapshots of the Python processes
+TRACEMALLOC_ENV_VAR = "CHESS_BOT_TRACEMALLOC"
+
+# interval: seconds between two samples
+# thresholds: RSS (MB) per process role above which the recycle action runs
+# action: "reload" reloads the page, "restart_engine" restarts the engine
+# process. The action runs between two games (or puzzles)
+RECYCLE = {
+    "interval": 5,
+    "thresholds": {
+        "browser": 4000,
+        "engine": 4000,
+        "bot": 1000,
+        "overlay": 500,
+        "gui": 1000,
+    },
+    "action": "reload",
+}
+
+# Roles counted with the descendants of their processes: the engine host
+# starts Stockfish and chromedriver starts Chrome and its renderers
+TREE_ROLES = ("browser", "engine")
+
+# Number of allocation sites written in a tracemalloc snapshot
+TRACEMALLOC_TOP = 25
+
+
+def is_tracemalloc_enabled_by_env():
+    return os.environ.get(TRACEMALLOC_ENV_VAR, "0") not in ("", "0")
+
+
+# Traces the allocations of the current process and writes the top
+# allocation sites to monitor/<session>-<process>-<pid>-tracemalloc.txt
+# every interval seconds, so the growth between snapshots can be compared
+def start_tracemalloc_snapshots(session_id, process_name, interval=60):
+    tracemalloc.start()
+    path = os.path.join(MONITOR_DIR, f"{session_id}-{process_name}-{os.getpid()}-tracemalloc.txt")
+
+    def snapshot_thread():
+        while True:
+            time.sleep(interval)
+            statistics = tracemalloc.take_snapshot().statistics("lineno")[:TRACEMALLOC_TOP]
+            os.makedirs(MONITOR_DIR, exist_ok=True)
+            with open(path, "a") as f:
+                f.write(f"# {time.strftime('%Y-%m-%d %H:%M:%S')} traced={tracemalloc.get_traced_memory()[0] // 1024}KB\n")
+                for statistic in statistics:
+                    f.write(f"{statistic}\n")
+
+    thread = threading.Thread(target=snapshot_thread, daemon=True)
+    thread.start()
+
+
+# Samples the RSS and the CPU usage of the processes of every role
+# (a role is a list of pids, see TREE_ROLES) and appends
+# them to monitor/<session>.csv as "time,role,processes,rss_mb,cpu_percent"
+# lines. on_sample(samples) gets {role: (processes, rss_mb, cpu_percent)}
+# and on_threshold(role, rss_mb) is called when a role goes above its threshold
+class ResourceMonitor:
+    def __init__(self, session_id, get_pids_by_role, on_sample=None, on_threshold=None):
+        self.path = os.path.join(MONITOR_DIR, f"{session_id}.csv")
+        self.get_pids_by_role = get_pids_by_role
+        self.on_sample = on_sample
+        self.on_threshold = on_threshold
+        self.processes = {}
+        self.over_threshold = set()
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self.monitor_thread, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+
+    # Returns the psutil processes of pid and of its descendants if children
+    # is True. The Process objects are kept, since cpu_percent compares with
+    # the previous call
+    def get_processes(self, pid, children):
+        pids = [pid]
+        if children:
+            try:
+                pids += [child.pid for child in psutil.Process(pid).children(recursive=True)]
+            except psutil.Error:
+                return []
+
+        processes = []
+        for process_id in pids:
+            if process_id not in self.processes:
+                try:
+                    self.processes[process_id] = psutil.Process(process_id)
+                except psutil.Error:
+                    continue
+            processes.append(self.processes[process_id])
+        return processes
+
+    def sample(self):
+        samples = {}
+        for role, pids in self.get_pids_by_role().items():
+            count = 0
+            rss = 0
+            cpu = 0.0
+            for pid in pids:
+                if pid is None:
+                    continue
+                for process in self.get_processes(pid, role in TREE_ROLES):
+                    try:
+                        rss += process.memory_info().rss
+                        cpu += process.cpu_percent()
+                        count += 1
+                    except psutil.Error:
+                        self.processes.pop(process.pid, None)
+            if count:
+                samples[role] = (count, rss / (1024 * 1024), cpu)
+        return samples
+
+    def monitor_thread(self):
+        os.makedirs(MONITOR_DIR, exist_ok=True)
+        with open(self.path, "a") as f:
+            while self.running:
+                now = time.strftime("%Y-%m-%d %H:%M:%S")
+                samples = self.sample()
+                for role, (count, rss_mb, cpu) in samples.items():
+                    f.write(f"{now},{role},{count},{rss_mb:.0f},{cpu:.0f}\n")
+                f.flush()
+
+                if self.on_sample is not None:
+                    self.on_sample(samples)
+                for role, (count, rss_mb, cpu) in samples.items():
+                    threshold = RECYCLE["thresholds"].get(role)
+                    if threshold is None or rss_mb <= threshold:
+                        self.over_threshold.discard(role)
+                    elif role not in self.over_threshold:
+                        self.over_threshold.add(role)
+                        logging.warning(f"{role} uses {rss_mb:.0f} MB (threshold {threshold} MB)")
+                        if self.on_threshold is not None:
+                            self.on_threshold(role, rss_mb)
+
+                time.sleep(RECYCLE["interval"])
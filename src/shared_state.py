@@ -0,0 +1,184 @@
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+import chess
+
+# Layout of the segment:
+# seq (Q), game_id (I), ply_count (I),
+# search info: eval_cp (i), eval_mate (i), depth (I), pv_count (I), pv (MAX_PV * H),
+# arrows_count (I), arrows (MAX_ARROWS * 4 i), fen (FEN_SIZE s), plies (MAX_PLIES * H)
+MAX_PV = 8
+MAX_ARROWS = 4
+MAX_PLIES = 2048
+FEN_SIZE = 92
+
+SEQ = struct.Struct("<Q")
+GAME_ID = struct.Struct("<I")
+GAME_ID_OFFSET = 8
+PLY_COUNT = struct.Struct("<I")
+PLY_COUNT_OFFSET = 12
+SEARCH_INFO = struct.Struct("<iiII" + "H" * MAX_PV)
+SEARCH_INFO_OFFSET = 16
+ARROWS = struct.Struct("<I" + "i" * (MAX_ARROWS * 4))
+ARROWS_OFFSET = SEARCH_INFO_OFFSET + SEARCH_INFO.size
+FEN = struct.Struct(str(FEN_SIZE) + "s")
+FEN_OFFSET = ARROWS_OFFSET + ARROWS.size
+PLIES_OFFSET = FEN_OFFSET + FEN.size
+SEGMENT_SIZE = PLIES_OFFSET + MAX_PLIES * 2
+
+# Used when there is no mate score
+NO_MATE = 0
+
+
+# Encodes a move into 16 bits: from square, to square and promotion piece
+def encode_move(move):
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(value):
+    return chess.Move(value & 63, (value >> 6) & 63, (value >> 12) or None)
+
+
+# Converts a list of moves played from the starting position to SAN
+def moves_to_san(moves):
+    board = chess.Board()
+    sans = []
+    for move in moves:
+        sans.append(board.san(move))
+        board.push(move)
+    return sans
+
+
+# A fixed size shared memory segment holding the state of the current game.
+# It is written by the Stockfish Bot process and read by the GUI and the
+# overlay. Writes are guarded by a sequence lock (the sequence number is odd
+# while a write is in progress) and every reader has its own event that is
+# set after each write
+class SharedState:
+    def __init__(self, readers):
+        self.memory = shared_memory.SharedMemory(create=True, size=SEGMENT_SIZE)
+        self.memory.buf[:SEGMENT_SIZE] = bytes(SEGMENT_SIZE)
+        self.events = {reader: multiprocessing.Event() for reader in readers}
+
+    def get_seq(self):
+        return SEQ.unpack_from(self.memory.buf, 0)[0]
+
+    # The sequence number is made odd even if a killed writer left it odd
+    def begin_write(self):
+        SEQ.pack_into(self.memory.buf, 0, (self.get_seq() + 1) | 1)
+
+    def end_write(self):
+        SEQ.pack_into(self.memory.buf, 0, self.get_seq() + 1)
+        for event in self.events.values():
+            event.set()
+
+    # Runs read_function until it wasn't interrupted by a write
+    def read(self, read_function):
+        while True:
+            seq = self.get_seq()
+            if seq % 2 == 1:
+                time.sleep(0.001)
+                continue
+            result = read_function(self.memory.buf)
+            if self.get_seq() == seq:
+                return result
+
+    # Blocks until something was written or the timeout expired
+    def wait(self, reader, timeout=None):
+        event = self.events[reader]
+        changed = event.wait(timeout)
+        event.clear()
+        return changed
+
+    # Starts a new game from the given moves
+    def reset(self, moves=()):
+        board = chess.Board()
+        for move in moves:
+            board.push(move)
+
+        self.begin_write()
+        buf = self.memory.buf
+        GAME_ID.pack_into(buf, GAME_ID_OFFSET, GAME_ID.unpack_from(buf, GAME_ID_OFFSET)[0] + 1)
+        SEARCH_INFO.pack_into(buf, SEARCH_INFO_OFFSET, 0, NO_MATE, 0, 0, *([0] * MAX_PV))
+        ARROWS.pack_into(buf, ARROWS_OFFSET, *([0] * (1 + MAX_ARROWS * 4)))
+        self.write_moves(board, board.move_stack, 0)
+        self.end_write()
+
+    # Adds the last move pushed on the board
+    def push_move(self, board):
+        self.begin_write()
+        self.write_moves(board, [board.peek()], PLY_COUNT.unpack_from(self.memory.buf, PLY_COUNT_OFFSET)[0])
+        self.end_write()
+
+    # Writes the moves starting at ply ply_count and the resulting position
+    def write_moves(self, board, moves, ply_count):
+        buf = self.memory.buf
+        for move in moves:
+            if ply_count < MAX_PLIES:
+                struct.pack_into("<H", buf, PLIES_OFFSET + ply_count * 2, encode_move(move))
+                ply_count += 1
+        PLY_COUNT.pack_into(buf, PLY_COUNT_OFFSET, ply_count)
+        FEN.pack_into(buf, FEN_OFFSET, board.fen().encode())
+
+    # Sets the arrows drawn by the overlay
+    # Ex. [((x1, y1), (x2, y2))]
+    def set_arrows(self, arrows):
+        arrows = arrows[:MAX_ARROWS]
+        values = [0] * (MAX_ARROWS * 4)
+        for i, ((x1, y1), (x2, y2)) in enumerate(arrows):
+            values[i * 4:i * 4 + 4] = [x1, y1, x2, y2]
+
+        self.begin_write()
+        ARROWS.pack_into(self.memory.buf, ARROWS_OFFSET, len(arrows), *values)
+        self.end_write()
+
+    # Sets the latest search info. The evaluation is either
+    # in centipawns or in moves until mate (mate is then not NO_MATE)
+    def set_search_info(self, depth, cp, mate, pv):
+        pv = pv[:MAX_PV]
+        values = [encode_move(move) for move in pv] + [0] * (MAX_PV - len(pv))
+
+        self.begin_write()
+        SEARCH_INFO.pack_into(self.memory.buf, SEARCH_INFO_OFFSET, cp, mate, depth, len(pv), *values)
+        self.end_write()
+
+    def get_game_id(self):
+        return self.read(lambda buf: GAME_ID.unpack_from(buf, GAME_ID_OFFSET)[0])
+
+    # Returns the game id and the moves starting at ply start
+    def get_moves(self, start=0):
+        def read_moves(buf):
+            game_id = GAME_ID.unpack_from(buf, GAME_ID_OFFSET)[0]
+            ply_count = PLY_COUNT.unpack_from(buf, PLY_COUNT_OFFSET)[0]
+            plies = buf[PLIES_OFFSET:PLIES_OFFSET + ply_count * 2].cast("H")
+            return game_id, [decode_move(value) for value in plies[start:]]
+
+        return self.read(read_moves)
+
+    def get_arrows(self):
+        def read_arrows(buf):
+            values = ARROWS.unpack_from(buf, ARROWS_OFFSET)
+            return [((values[1 + i * 4], values[2 + i * 4]), (values[3 + i * 4], values[4 + i * 4])) for i in range(values[0])]
+
+        return self.read(read_arrows)
+
+    # Returns (depth, cp, mate, pv)
+    def get_search_info(self):
+        def read_search_info(buf):
+            values = SEARCH_INFO.unpack_from(buf, SEARCH_INFO_OFFSET)
+            return values[2], values[0], values[1], [decode_move(value) for value in values[4:4 + values[3]]]
+
+        return self.read(read_search_info)
+
+    def get_fen(self):
+        return self.read(lambda buf: FEN.unpack_from(buf, FEN_OFFSET)[0].rstrip(b"\0").decode())
+
+    def close(self):
+        self.memory.close()
+
+    # Frees the segment once every process closed it,
+    # called by the process that created it
+    def unlink(self):
+        self.memory.unlink()
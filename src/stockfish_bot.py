@@ -1,32 +1,59 @@
 from random import random
 
 import multiprocess
-from stockfish import Stockfish
-import pyautogui
-import time
-import sys
 import os
+import time
 import chess
 import re
 from grabbers.chesscom_grabber import ChesscomGrabber
 from grabbers.lichess_grabber import LichessGrabber
-from utilities import char_to_num
+from grabbers.lichess_socket_grabber import LichessSocketGrabber
+from grabbers.screen_grabber import ScreenGrabber
+from replay.recorder import RECORDINGS_DIR, SessionRecorder
+from engines.engine_host import EngineClient, engine_parameters, EARLY_STOP
+from engines.engine_server import ENGINE_SERVER_ENV_VAR, RemoteEngineClient
+from engines.puzzle_index import load_puzzle_index
+from shared_state import NO_MATE
+from profiler import SamplingProfiler
+from resource_monitor import is_tracemalloc_enabled_by_env, start_tracemalloc_snapshots
+from log_pipeline import get_ply_logger, setup_process_logging
+import logging
+from inputs.cdp_input_backend import CdpInputBackend
+from utilities import char_to_num, LatencyStats
 import keyboard
 
 
+# Depth of the search that confirms a recapture
+RECAPTURE_DEPTH = 6
+
+# Time between two checks of the game over window. The board detects the
+# endings by rule itself, the window is only needed for the endings it
+# can't know about (resignation, timeout, abort)
+GAME_OVER_CHECK_INTERVAL = 0.5
+
+
 class StockfishBot(multiprocess.Process):
-    def __init__(self, chrome_url, chrome_session_id, website, pipe, overlay_queue, stockfish_path, enable_manual_mode, enable_mouseless_mode, enable_non_stop_puzzles, bongcloud, slow_mover, skill_level, stockfish_depth, memory, cpu_threads):
+    def __init__(self, chrome_url, chrome_session_id, chrome_debugger_address, website, pipe, state, engine_pipe, enable_manual_mode, enable_mouseless_mode, input_backend, enable_screen_grabber, enable_socket_grabber, enable_non_stop_puzzles, enable_early_stop, enable_fast_path, enable_recording, bongcloud, slow_mover, skill_level, stockfish_depth, memory, cpu_threads, speculation_threads, profile_tag, log_queue, log_context):
         multiprocess.Process.__init__(self)
 
         self.chrome_url = chrome_url
         self.chrome_session_id = chrome_session_id
+        self.chrome_debugger_address = chrome_debugger_address
         self.website = website
         self.pipe = pipe
-        self.overlay_queue = overlay_queue
-        self.stockfish_path = stockfish_path
+        self.state = state
+        self.engine_pipe = engine_pipe
         self.enable_manual_mode = enable_manual_mode
         self.enable_mouseless_mode = enable_mouseless_mode
+        self.input_backend_name = input_backend
+        self.input_backend = None
+        self.enable_screen_grabber = enable_screen_grabber
+        self.enable_socket_grabber = enable_socket_grabber
         self.enable_non_stop_puzzles = enable_non_stop_puzzles
+        self.enable_early_stop = enable_early_stop
+        self.enable_fast_path = enable_fast_path
+        self.enable_recording = enable_recording
+        self.recorder = None
         self.bongcloud = bongcloud
         self.slow_mover = slow_mover
         self.skill_level = skill_level
@@ -34,8 +61,30 @@ class StockfishBot(multiprocess.Process):
         self.grabber = None
         self.memory = memory
         self.cpu_threads = cpu_threads
+        self.speculation_threads = speculation_threads
+        self.profile_tag = profile_tag
+        self.log_queue = log_queue
+        self.log_context = log_context
         self.is_white = None
 
+        # Search statistics
+        self.search_stats = LatencyStats("search")
+        self.early_stops = 0
+        self.early_stop_saved = 0.0
+        self.fast_path_stats = LatencyStats("fast path")
+
+        # Speculation on the opponent replies
+        self.engine = None
+        self.speculating = False
+        self.speculated_move = None
+        self.speculation_hits = 0
+        self.speculation_total = 0
+
+        # Solutions of the lichess puzzles, see engines.puzzle_index
+        self.puzzle_index = None
+        self.puzzle_lookup_stats = LatencyStats("puzzle index lookup")
+        self.puzzle_hits = 0
+
     # Converts a move to screen coordinates
     # Example: "a1" -> (x, y)
     def move_to_screen_pos(self, move):
@@ -67,57 +116,248 @@ class StockfishBot(multiprocess.Process):
         return (start_pos_x, start_pos_y), (end_pos_x, end_pos_y)
 
 
-    def make_move(self, move):  # sourcery skip: extract-method
-        # Get the start and end position screen coordinates
-        start_pos, end_pos = self.get_move_pos(move)
-
-        # Drag the piece from the start to the end position
-        pyautogui.moveTo(start_pos[0], start_pos[1])
-        pyautogui.dragTo(end_pos[0], end_pos[1])
-
-        # Check for promotion. If there is a promotion,
-        # promote to the corresponding piece type
-        if len(move) == 5:
-            time.sleep(0.1)
-            end_pos_x = None
-            end_pos_y = None
-            if move[4] == "n":
-                end_pos_x, end_pos_y = self.move_to_screen_pos(move[2] + str(int(move[3]) - 1))
-            elif move[4] == "r":
-                end_pos_x, end_pos_y = self.move_to_screen_pos(move[2] + str(int(move[3]) - 2))
-            elif move[4] == "b":
-                end_pos_x, end_pos_y = self.move_to_screen_pos(move[2] + str(int(move[3]) - 3))
-
-            pyautogui.moveTo(x=end_pos_x, y=end_pos_y)
-            pyautogui.click(button='left')
+    def make_move(self, move):
+        self.input_backend.make_move(move)
+
+    # Picks how the moves are made on the board. Mouseless mode
+    # needs DevTools events wherever the lichess socket can't be used
+    def create_input_backend(self):
+        if self.input_backend_name == "cdp" or self.enable_mouseless_mode:
+            return CdpInputBackend(self.grabber, self.is_white)
+
+        # pyautogui imports Tk, so the headless daemon never imports it
+        from inputs.pyautogui_input_backend import PyautoguiInputBackend
+        return PyautoguiInputBackend(self.grabber, self.is_white)
+
+    # Searches for the best move while sharing the streamed
+    # depth, score and principal variation with the GUI
+    def search_best_move(self, stockfish, board):
+        # The scores are shown from the white side
+        sign = 1 if board.turn == chess.WHITE else -1
+
+        def on_info(info):
+            pv = []
+            for move in info["pv"]:
+                try:
+                    pv.append(chess.Move.from_uci(move))
+                except ValueError:
+                    break
+            mate = NO_MATE if info["mate"] is None else sign * info["mate"]
+            self.state.set_search_info(info["depth"], sign * (info["cp"] or 0), mate, pv)
+
+        result = stockfish.search(EARLY_STOP if self.enable_early_stop else None, on_info)
+        self.search_stats.add(result["elapsed"])
+        if result["stopped_early"]:
+            self.early_stops += 1
+            self.early_stop_saved += result["saved"]
+
+        return result["move"]
+
+    # Returns a move that can be played without a full search:
+    # the only legal move, a mate in one, or a recapture on the square
+    # of the last capture that a shallow search agrees with.
+    # Returns None if there is no such move
+    def find_forced_move(self, stockfish, board):
+        legal_moves = list(board.legal_moves)
+        if len(legal_moves) == 1:
+            return legal_moves[0].uci()
+
+        for move in legal_moves:
+            board.push(move)
+            is_mate = board.is_checkmate()
+            board.pop()
+            if is_mate:
+                return move.uci()
+
+        if not board.move_stack:
+            return None
+
+        # Check if the opponent just captured
+        last_move = board.pop()
+        was_capture = board.is_capture(last_move)
+        board.push(last_move)
+        if not was_capture:
+            return None
+
+        recaptures = [move for move in legal_moves if move.to_square == last_move.to_square]
+        if not recaptures:
+            return None
+
+        # Recapture with the least valuable piece if the engine agrees
+        recapture = min(recaptures, key=lambda move: board.piece_type_at(move.from_square))
+        result = stockfish.search(None, None, RECAPTURE_DEPTH)
+        if result["move"] == recapture.uci():
+            return result["move"]
+        return None
+
+    # Starts analyzing the likeliest opponent replies while waiting for the opponent
+    def start_speculation(self, stockfish, board):
+        if self.speculation_threads > 0:
+            stockfish.speculate([move.uci() for move in board.move_stack], self.speculation_threads)
+            self.speculating = True
+
+    # Keeps the speculated answer to the opponent move, if there is one
+    def take_speculation(self, stockfish, board):
+        if not self.speculating:
+            return
+        self.speculating = False
+        self.speculated_move = stockfish.take_speculation([move.uci() for move in board.move_stack])
+        self.speculation_total += 1
+        if self.speculated_move is not None:
+            self.speculation_hits += 1
+
+    # Returns the stored solution of the puzzle position, or None
+    def find_puzzle_move(self, board):
+        start_time = time.perf_counter()
+        move = self.puzzle_index.lookup(board)
+        self.puzzle_lookup_stats.add(time.perf_counter() - start_time)
+        if move is not None:
+            self.puzzle_hits += 1
+        return move
+
+    # Finds the best move, skipping the full search for puzzle solutions,
+    # forced moves and replies that were speculated on
+    def think(self, stockfish, board):
+        if self.puzzle_index is not None:
+            move = self.find_puzzle_move(board)
+            if move is not None:
+                return move
+
+        if self.speculated_move is not None:
+            move = self.speculated_move
+            self.speculated_move = None
+            if board.is_legal(chess.Move.from_uci(move)):
+                return move
+
+        if self.enable_fast_path:
+            start_time = time.perf_counter()
+            move = self.find_forced_move(stockfish, board)
+            if move is not None:
+                self.fast_path_stats.add(time.perf_counter() - start_time)
+                return move
+
+        return self.search_best_move(stockfish, board)
+
+    def send_stats(self):
+        stats = self.grabber.get_stats()
+        if self.input_backend is not None:
+            stats.append(self.input_backend.stats)
+
+        stats.append(self.search_stats)
+        stats.append(self.fast_path_stats)
+
+        for stat in stats:
+            if stat.samples:
+                logging.info(stat.summary())
+        logging.info(self.grabber.get_element_cache_summary())
+
+        # The latency saved is estimated with the average full search time
+        if self.fast_path_stats.samples:
+            search_mean = sum(self.search_stats.samples) / max(1, len(self.search_stats.samples))
+            saved = search_mean * len(self.fast_path_stats.samples) - sum(self.fast_path_stats.samples)
+            logging.info(f"fast path: {len(self.fast_path_stats.samples)} moves, saved ~{max(0.0, saved):.2f}s")
+
+        if self.search_stats.samples:
+            logging.info(f"early stop: {self.early_stops}/{len(self.search_stats.samples)} searches, saved ~{self.early_stop_saved:.2f}s")
+
+        if self.puzzle_lookup_stats.samples:
+            logging.info(self.puzzle_lookup_stats.summary())
+            logging.info(f"puzzle index: {self.puzzle_hits}/{len(self.puzzle_lookup_stats.samples)} positions found ({self.puzzle_hits / len(self.puzzle_lookup_stats.samples):.0%})")
+
+        if self.speculation_total:
+            logging.info(f"speculation: {self.speculation_hits}/{self.speculation_total} replies predicted ({self.speculation_hits / self.speculation_total:.0%})")
+
+    # Saves the game recorded so far, see replay.recorder
+    def save_recording(self, final=False):
+        if self.recorder is None:
+            return
+        moves = [move.uci() for move in self.state.get_moves()[1]]
+        self.recorder.save(moves, final)
+
+    # Returns True if the game ended by rule (checkmate, stalemate,
+    # insufficient material, fivefold repetition or the 75-move rule).
+    # The draws that have to be claimed (threefold repetition, 50-move
+    # rule) are left to the game over check of the site
+    def is_game_over_by_rule(self, board):
+        outcome = board.outcome()
+        if outcome is None:
+            return False
+        logging.info(f"Game over: {outcome.termination.name.lower()} {outcome.result()}")
+        return True
 
     def wait_for_gui_to_delete(self):
         while self.pipe.recv() != "DELETE":
             pass
 
+    def on_game_over(self):
+        # Stop the speculation searches
+        if self.speculating:
+            self.engine.take_speculation([])
+            self.speculating = False
+
+        self.send_stats()
+        self.save_recording(final=True)
+
+        # Send restart message to GUI
+        if self.enable_non_stop_puzzles and self.grabber.is_game_puzzles():
+            self.grabber.click_puzzle_next()
+            self.pipe.send("RESTART")
+            self.wait_for_gui_to_delete()
+
     def run(self):
+        setup_process_logging(self.log_queue, self.log_context)
+
+        profiler = None
+        if self.profile_tag is not None:
+            profiler = SamplingProfiler("bot", self.profile_tag)
+            profiler.start()
+        if is_tracemalloc_enabled_by_env():
+            start_tracemalloc_snapshots(self.log_context.session_id, "bot")
+
+        try:
+            self.play()
+        finally:
+            if profiler is not None:
+                profiler.stop()
+
+    def play(self):
         # sourcery skip: extract-duplicate-method, switch, use-fstring-for-concatenation
         if self.website == "chesscom":
             self.grabber = ChesscomGrabber(self.chrome_url, self.chrome_session_id)
+        elif self.enable_socket_grabber and self.chrome_debugger_address is not None:
+            # With the Record option the frames are saved together with the
+            # DOM detection times (see grabbers.lichess_socket_grabber.replay)
+            record_path = None
+            if self.enable_recording:
+                os.makedirs(RECORDINGS_DIR, exist_ok=True)
+                record_path = os.path.join(RECORDINGS_DIR, time.strftime("%Y%m%d-%H%M%S") + "-lichess-frames.jsonl")
+            self.grabber = LichessSocketGrabber(
+                self.chrome_url, self.chrome_session_id, self.chrome_debugger_address, self.enable_recording, record_path
+            )
         else:
             self.grabber = LichessGrabber(self.chrome_url, self.chrome_session_id)
-
-        # Initialize Stockfish
-        parameters = {
-            "Threads": self.cpu_threads,
-            "Hash": self.memory,
-            "Ponder": "true",
-            "Slow Mover": self.slow_mover,
-            "Skill Level": self.skill_level
-        }
-        try:
-            stockfish = Stockfish(path=self.stockfish_path, depth=self.stockfish_depth, parameters=parameters)
-        except PermissionError:
-            self.pipe.send("ERR_PERM")
-            return
-        except OSError:
-            self.pipe.send("ERR_EXE")
+        if self.enable_screen_grabber:
+            # With the Record option the captures are saved for the
+            # grabbers.board_recognizer benchmark
+            record_dir = None
+            if self.enable_recording:
+                record_dir = os.path.join(RECORDINGS_DIR, time.strftime("%Y%m%d-%H%M%S") + "-screen")
+            self.grabber = ScreenGrabber(self.grabber, record_dir)
+
+        # Use the engine that the GUI already started (or the engine
+        # server if one is set) and reconfigure it in place if the parameters changed
+        engine_server = os.environ.get(ENGINE_SERVER_ENV_VAR)
+        if engine_server:
+            stockfish = RemoteEngineClient(engine_server)
+        else:
+            stockfish = EngineClient(self.engine_pipe)
+        self.engine = stockfish
+        status = stockfish.get_status()
+        if status != "OK":
+            self.pipe.send(status)
             return
+        parameters = engine_parameters(self.slow_mover, self.skill_level, self.memory, self.cpu_threads)
+        stockfish.configure(self.stockfish_depth, parameters)
 
         try:
             # Return if the board element is not found
@@ -131,6 +371,13 @@ class StockfishBot(multiprocess.Process):
             if self.is_white is None:
                 self.pipe.send("ERR_COLOR")
                 return
+            self.input_backend = self.create_input_backend()
+
+            # Play the known solutions of the lichess puzzles without searching
+            if self.grabber.is_game_puzzles():
+                self.puzzle_index = load_puzzle_index()
+                if self.puzzle_index is None:
+                    logging.info("No puzzle index, the puzzles are searched")
 
             # Get the starting position
             # Return if the starting position is not found
@@ -154,12 +401,20 @@ class StockfishBot(multiprocess.Process):
             # Update Stockfish with the starting position
             stockfish.set_position(move_list_uci)
 
+            # Share the starting position with the GUI and the overlay
+            self.state.reset(board.move_stack)
+
+            # Record the game for replaying it offline
+            if self.enable_recording:
+                self.recorder = SessionRecorder(self.grabber, self.website, self.is_white)
+                if not self.recorder.start():
+                    logging.warning("Move list not found, the game is not recorded")
+                    self.recorder = None
+
             # Notify GUI that bot is ready
             self.pipe.send("START")
 
-            # Send the first moves to the GUI (if there are any)
-            if len(move_list) > 0:
-                self.pipe.send("M_MOVE" + ",".join(move_list))
+            ply_logger = get_ply_logger()
 
             # Start the game loop
             while True:
@@ -181,15 +436,15 @@ class StockfishBot(multiprocess.Process):
                         # Hardcoded bongcloud move is not legal,
                         # so find a legal move
                         if not board.is_legal(chess.Move.from_uci(move)):
-                            move = stockfish.get_best_move()
+                            move = self.think(stockfish, board)
                     else:
-                        move = stockfish.get_best_move()
+                        move = self.think(stockfish, board)
 
                     # Wait for keypress or player movement if in manual mode
                     self_moved = False
                     if self.enable_manual_mode:
                         move_start_pos, move_end_pos = self.get_move_pos(move)
-                        self.overlay_queue.put([
+                        self.state.set_arrows([
                             ((int(move_start_pos[0]), int(move_start_pos[1])), (int(move_end_pos[0]), int(move_end_pos[1]))),
                         ])
                         while True:
@@ -206,43 +461,44 @@ class StockfishBot(multiprocess.Process):
                                 break
 
                     if not self_moved:
-                        move_san = board.san(chess.Move(chess.parse_square(move[0:2]), chess.parse_square(move[2:4])))
+                        move_san = board.san(chess.Move.from_uci(move))
                         board.push_uci(move)
                         stockfish.make_moves_from_current_position([move])
                         move_list.append(move_san)
-                        if self.enable_mouseless_mode and not self.grabber.is_game_puzzles():
-                            self.grabber.make_mouseless_move(move, move_count + 1)
+                        if self.enable_mouseless_mode and self.website == "lichess" and not self.grabber.is_game_puzzles():
+                            # Play it on the board if the socket lost it
+                            if not self.grabber.make_mouseless_move(move, move_count + 1):
+                                self.make_move(move)
                         else:
                             self.make_move(move)
+                        self.grabber.on_own_move(move_san)
 
-                    self.overlay_queue.put([])
-
-                    # Send the move to the GUI
-                    self.pipe.send("S_MOVE" + move_san)
+                    # Clear the arrows and share the move with the GUI
+                    self.state.set_arrows([])
+                    self.state.push_move(board)
+                    ply_logger.debug("ply", extra={"ply": len(board.move_stack), "move": move_san, "side": "bot"})
+                    if len(board.move_stack) % 10 == 0:
+                        self.save_recording()
 
                     # Check if the game is over
-                    if board.is_checkmate():
-                        # Send restart message to GUI
-                        if self.enable_non_stop_puzzles and self.grabber.is_game_puzzles():
-                            self.grabber.click_puzzle_next()
-                            self.pipe.send("RESTART")
-                            self.wait_for_gui_to_delete()
+                    if self.is_game_over_by_rule(board):
+                        self.on_game_over()
                         return
 
+                    self.start_speculation(stockfish, board)
                     time.sleep(0.1)
 
                 # Wait for a response from the opponent
                 # by finding the differences between
                 # the previous and current position
                 previous_move_list = move_list.copy()
+                next_game_over_check = 0
                 while True:
-                    if self.grabber.is_game_over():
-                        # Send restart message to GUI
-                        if self.enable_non_stop_puzzles and self.grabber.is_game_puzzles():
-                            self.grabber.click_puzzle_next()
-                            self.pipe.send("RESTART")
-                            self.wait_for_gui_to_delete()
-                        return
+                    if time.monotonic() >= next_game_over_check:
+                        if self.grabber.is_game_over():
+                            self.on_game_over()
+                            return
+                        next_game_over_check = time.monotonic() + GAME_OVER_CHECK_INTERVAL
                     move_list = self.grabber.get_move_list()
                     if move_list is None:
                         return
@@ -251,19 +507,20 @@ class StockfishBot(multiprocess.Process):
 
                 # Get the move that the opponent made
                 move = move_list[-1]
-                self.pipe.send("S_MOVE" + move)
                 board.push_san(move)
+                self.state.push_move(board)
+                ply_logger.debug("ply", extra={"ply": len(board.move_stack), "move": move, "side": "opponent"})
+                if len(board.move_stack) % 10 == 0:
+                    self.save_recording()
                 stockfish.make_moves_from_current_position([str(board.peek())])
-                if board.is_checkmate():
-                    # Send restart message to GUI
-                    if self.enable_non_stop_puzzles and self.grabber.is_game_puzzles():
-                        self.grabber.click_puzzle_next()
-                        self.pipe.send("RESTART")
-                        self.wait_for_gui_to_delete()
-
+                if self.is_game_over_by_rule(board):
+                    self.on_game_over()
                     return
-        except Exception as e:
-            print(e)
-            exc_type, exc_obj, exc_tb = sys.exc_info()
-            fname = os.path.split(exc_tb.tb_frame.f_code.co_filename)[1]
-            print(exc_type, fname, exc_tb.tb_lineno)
+                self.take_speculation(stockfish, board)
+        except Exception:
+            logging.exception("Stockfish Bot stopped by an error")
+
+
+# Runs the bot in the current process, used by the parked bot worker (see worker_pool)
+def run_bot(**arguments):
+    StockfishBot(**arguments).run()
@@ -30,3 +30,36 @@ def attach_to_session(executor_url, session_id):
     WebDriver.execute = original_execute
 
     return driver
+
+
+# Sends a Chrome DevTools Protocol command through a webdriver
+# that was attached with attach_to_session. The plain Remote
+# driver doesn't know the chromedriver CDP endpoint, so register it
+def execute_cdp_cmd(driver, cmd, params):
+    driver.command_executor._commands["executeCdpCommand"] = ("POST", "/session/$sessionId/goog/cdp/execute")
+    return driver.execute("executeCdpCommand", {"cmd": cmd, "params": params})["value"]
+
+
+# Collects durations (in seconds) and summarizes them
+class LatencyStats:
+    def __init__(self, name):
+        self.name = name
+        self.samples = []
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+
+    # Returns the percentile of the samples in milliseconds
+    def percentile(self, p):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+        return ordered[index] * 1000
+
+    # Ex. "input[cdp]: n=40 mean=6.1ms p50=5.8ms p95=9.3ms"
+    def summary(self):
+        if not self.samples:
+            return f"{self.name}: n=0"
+        mean = sum(self.samples) / len(self.samples) * 1000
+        return f"{self.name}: n={len(self.samples)} mean={mean:.1f}ms p50={self.percentile(50):.1f}ms p95={self.percentile(95):.1f}ms"
@@ -0,0 +1,87 @@
+import importlib
+import logging
+
+import multiprocess
+
+
+# A process started ahead of time that waits for the rest of the
+# arguments of its target, so the process spawn and the imports are done
+# before Start is pressed. The arguments that can only be given to a
+# process when it starts (pipes, the shared state, the log queue) are
+# passed here as keyword arguments, the others are sent with launch()
+# Ex. ParkedWorker(run_bot, {"pipe": child_conn, "state": state, ...}).launch({"website": "lichess", ...})
+class ParkedWorker(multiprocess.Process):
+    def __init__(self, target, arguments, preload=(), name=None):
+        multiprocess.Process.__init__(self, name=name)
+        self.daemon = True
+
+        self.target = target
+        self.arguments = arguments
+        self.preload = preload
+        self.control, self.child_control = multiprocess.Pipe()
+
+    def run(self):
+        # Import the modules the target imports only when they are used
+        for module in self.preload:
+            try:
+                importlib.import_module(module)
+            except Exception:
+                pass
+
+        try:
+            arguments = self.child_control.recv()
+        except EOFError:
+            return
+        self.target(**self.arguments, **arguments)
+
+    # Runs the target with the remaining keyword arguments
+    def launch(self, arguments):
+        self.control.send(arguments)
+
+
+# Keeps one bot worker and one overlay worker parked. They are started
+# again with new arguments when the engine is replaced, since the bot
+# worker was given the pipe of the previous engine
+class WorkerPool:
+    def __init__(self, bot_target, overlay_target, preload=()):
+        self.bot_target = bot_target
+        self.overlay_target = overlay_target
+        self.preload = preload
+        self.bot = None
+        self.bot_pipe = None
+        self.overlay = None
+
+    # Parks the workers that are missing
+    def park(self, state, engine_pipe, log_queue):
+        if self.bot is None or not self.bot.is_alive():
+            self.bot_pipe, child_conn = multiprocess.Pipe()
+            self.bot = ParkedWorker(
+                self.bot_target,
+                {"pipe": child_conn, "state": state, "engine_pipe": engine_pipe, "log_queue": log_queue},
+                self.preload,
+                "StockfishBot",
+            )
+            self.bot.start()
+
+        if self.overlay is None or not self.overlay.is_alive():
+            self.overlay = ParkedWorker(self.overlay_target, {"state": state, "log_queue": log_queue}, name="Overlay")
+            self.overlay.start()
+        logging.info("Bot and overlay workers parked")
+
+    # Returns the parked (bot, bot pipe, overlay) and forgets them,
+    # so the next park() starts new ones
+    def take(self, state, engine_pipe, log_queue):
+        self.park(state, engine_pipe, log_queue)
+        workers = (self.bot, self.bot_pipe, self.overlay)
+        self.bot = None
+        self.bot_pipe = None
+        self.overlay = None
+        return workers
+
+    def stop(self):
+        for worker in (self.bot, self.overlay):
+            if worker is not None and worker.is_alive():
+                worker.kill()
+        self.bot = None
+        self.bot_pipe = None
+        self.overlay = None